@@ -0,0 +1,230 @@
+"""
+Batch-mode model calls for large crawls.
+
+Instead of sending each chat completion as it comes up, BatchQueue collects the
+pending requests into a JSONL file in the OpenAI Batch API format, runs the
+file as one batch and hands each reply back to its waiting caller by
+custom_id. Batches cost half as much as interactive calls and have their own
+quota, so the fetch stage runs at full speed while the model catches up a
+batch at a time. A crawl goes through several rounds, because e.g. the pages a
+directory links to are only fetched once the directory has been classified.
+
+Two runners take the same files:
+
+- OpenAIBatchRunner uploads the file, creates a batch and polls it.
+- LocalBatchRunner answers each line with a local function, for tests and
+  development runs.
+
+Input and output files are kept under the batch directory for inspection.
+"""
+import asyncio
+import json
+import os
+import time
+
+BATCH_DIR = os.path.join(".cache", "batches")
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_MAX_REQUESTS = 5000  # per file; the API allows up to 50,000
+BATCH_LINGER = 5.0  # seconds without new requests before a partial batch is sent
+BATCH_POLL_INTERVAL = 30.0
+
+_FINISHED = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchRequestError(RuntimeError):
+    """
+    One request's batch failed, or its line was missing from the output (as
+    happens with expired and cancelled batches).
+    """
+
+
+def batch_line(custom_id, body):
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+def write_batch_file(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+
+def read_batch_file(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def result_line(custom_id, content=None, status_code=200, error=None):
+    """
+    One line of a batch output file, as the Batch API writes it.
+    """
+    if error is not None:
+        return {"custom_id": custom_id, "response": None, "error": {"code": "error", "message": error}}
+    body = {
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    }
+    return {"custom_id": custom_id, "response": {"status_code": status_code, "body": body}, "error": None}
+
+def parse_results(lines):
+    """
+    Maps each custom_id in batch output lines to ("ok", reply text) or
+    ("error", message).
+    """
+    results = {}
+    for line in lines:
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error"):
+            results[custom_id] = ("error", line["error"].get("message") or str(line["error"]))
+        elif response.get("status_code") != 200:
+            error = body.get("error") or {}
+            results[custom_id] = ("error", error.get("message") or f"status {response.get('status_code')}")
+        else:
+            try:
+                results[custom_id] = ("ok", body["choices"][0]["message"]["content"])
+            except (KeyError, IndexError, TypeError):
+                results[custom_id] = ("error", "malformed batch response")
+    return results
+
+
+class LocalBatchRunner:
+    """
+    Runs a batch file in-process: `respond(body)` returns the reply text for one
+    request body (and may be a coroutine function).
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+
+    async def _answer(self, line):
+        try:
+            content = self.respond(line["body"])
+            if asyncio.iscoroutine(content):
+                content = await content
+            return result_line(line["custom_id"], content)
+        except Exception as e:
+            return result_line(line["custom_id"], error=str(e))
+
+    async def run(self, input_path, output_path):
+        lines = read_batch_file(input_path)
+        results = await asyncio.gather(*(self._answer(line) for line in lines))
+        write_batch_file(output_path, results)
+        return results
+
+
+class OpenAIBatchRunner:
+    """
+    Runs a batch file through the OpenAI Batch API with an AsyncOpenAI client.
+    """
+
+    def __init__(self, client, poll_interval=BATCH_POLL_INTERVAL):
+        self.client = client
+        self.poll_interval = poll_interval
+
+    async def _download(self, file_id):
+        if not file_id:
+            return []
+        content = await self.client.files.content(file_id)
+        return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+    async def run(self, input_path, output_path):
+        with open(input_path, "rb") as f:
+            uploaded = await self.client.files.create(file=(os.path.basename(input_path), f.read()), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+        )
+        print(f" Batch {batch.id}: submitted {os.path.basename(input_path)}")
+        while batch.status not in _FINISHED:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+        print(f" Batch {batch.id}: {batch.status}")
+        # Expired and cancelled batches still return whatever finished
+        results = await self._download(batch.output_file_id) + await self._download(batch.error_file_id)
+        write_batch_file(output_path, results)
+        return results
+
+
+class BatchQueue:
+    """
+    Collects chat completion requests and runs them as batches. submit()
+    returns the reply text, or raises BatchRequestError with the batch's error.
+    A batch is sent when BATCH_MAX_REQUESTS are waiting, or when no new
+    request has arrived for `linger` seconds.
+    """
+
+    def __init__(self, runner, directory=BATCH_DIR, max_requests=BATCH_MAX_REQUESTS, linger=BATCH_LINGER):
+        self.runner = runner
+        self.directory = directory
+        self.max_requests = max_requests
+        self.linger = linger
+        self.pending = {}  # custom_id -> (body, future)
+        self.prefix = time.strftime("%Y%m%d-%H%M%S")
+        self.sent = 0
+        self._timer = None
+        self._tasks = set()
+        self.stats = {"batches": 0, "requests": 0, "errors": 0}
+
+    async def submit(self, custom_id, body):
+        if custom_id not in self.pending:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[custom_id] = (body, future)
+        future = self.pending[custom_id][1]
+        if len(self.pending) >= self.max_requests:
+            self._send()
+        elif self._timer is None:
+            self._timer = asyncio.ensure_future(self._send_when_idle())
+        return await future
+
+    async def _send_when_idle(self):
+        # Wait for the pipeline to stop producing requests, then send what's there
+        while True:
+            size = len(self.pending)
+            await asyncio.sleep(self.linger)
+            if not self.pending or len(self.pending) == size:
+                break
+        self._timer = None
+        if self.pending:
+            self._send()
+
+    def _send(self):
+        pending, self.pending = self.pending, {}
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.ensure_future(self._run(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending):
+        self.sent += 1
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}-{self.sent:04d}"
+        input_path = os.path.join(self.directory, name + "-input.jsonl")
+        output_path = os.path.join(self.directory, name + "-output.jsonl")
+        write_batch_file(input_path, [batch_line(cid, body) for cid, (body, _) in pending.items()])
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(pending)
+        try:
+            results = parse_results(await self.runner.run(input_path, output_path))
+        except Exception as e:
+            results = {}
+            missing = f"batch failed: {e}"
+        else:
+            missing = "no result in batch output"
+        for custom_id, (_, future) in pending.items():
+            if future.done():
+                continue
+            status, value = results.get(custom_id, ("error", missing))
+            if status == "ok":
+                future.set_result(value)
+            else:
+                self.stats["errors"] += 1
+                future.set_exception(BatchRequestError(value))
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,215 @@
+"""
+Main-text extraction with boilerplate stripped.
+
+The text sent to the model is truncated (3000 characters to classify, 6000 to
+parse), so every cookie banner, menu and footer link ahead of the content
+pushes the content out of the window. main_text() walks the page once, splits
+it into blocks and keeps only the ones likely to carry content:
+
+- script, style, nav, forms and the like are dropped, as are elements whose
+  class or id marks them as cookie notices, menus, share bars or popups;
+- header, footer and aside keep only their h1-h3 headings and the blocks
+  holding contact details (a postcode, phone number or email address), which
+  is often where a food bank's address lives. Inside main or article they
+  are content: an article's header holds its title;
+- a block repeated on the page ("Read more", a second copy of the menu) is
+  kept once.
+
+Themes often wrap the whole page in something that looks like furniture
+(`<div class="uk-offcanvas-content">`, `<form id="aspnetForm">`), so an
+element holding <main> or most of the page's text is never dropped, and if
+the stripped text still comes out far shorter than the page's plain text,
+the plain text is used instead.
+
+The page's tree is only read, never modified, because the structured-data and
+pre-classifier passes use it too. `python bench.py compress` measures the
+token savings and contact-detail recall on saved pages.
+"""
+import re
+
+from bs4.element import NavigableString, PreformattedString, Tag
+
+from structured_data import UK_POSTCODE_RE
+
+MAX_TEXT = 9000  # characters kept, enough for any prompt window
+
+# Never content
+DROP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "nav", "form", "button", "select", "option", "textarea", "head", "title", "meta", "link",
+}
+# Never hold page content, however much text is inside
+OPAQUE_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "select", "option", "textarea", "head", "title", "meta", "link",
+}
+# An element holding more than this share of the page's text is a wrapper, not furniture
+WRAPPER_SHARE = 0.5
+# Below this share of the page's plain text, stripping has gone wrong; use the plain text
+MIN_KEPT_SHARE = 0.04
+# Page furniture that may still hold the organisation's contact details
+CONTACT_ONLY_TAGS = {"header", "footer", "aside"}
+# Within these, the above are part of the content
+CONTENT_TAGS = {"main", "article"}
+# Kept wherever they are, bar dropped elements; often the food bank's name
+HEADING_TAGS = {"h1", "h2", "h3"}
+
+_DROP_NAMES_RE = re.compile(
+    r"(?:^|[-_])(?:cookies?|consent|gdpr|breadcrumbs?|skip|social|share|sharing|newsletter|subscribe"
+    r"|popup|modal|navbar|nav|navigation|menu|offcanvas|masthead)(?:$|[-_])", re.I)
+_CONTACT_ONLY_NAMES_RE = re.compile(r"(?:^|[-_])(?:header|footer|sidebar|aside)(?:$|[-_])", re.I)
+
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol", "p", "pre", "section", "table",
+    "tr", "ul",
+}
+
+PHONE_RE = re.compile(r"(?:\+44\s?|\b0)\d(?:[\s-]?\d){8,9}\b")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+
+def has_contact_details(text):
+    return bool(UK_POSTCODE_RE.search(text.upper()) or PHONE_RE.search(text) or EMAIL_RE.search(text))
+
+def contact_details(text):
+    """
+    The postcodes, phone numbers (digits only) and email addresses in `text`.
+    """
+    phones = {"".join(p.split()).replace("-", "") for p in PHONE_RE.findall(text)}
+    postcodes = {f"{a} {b}" for a, b in UK_POSTCODE_RE.findall(text.upper())}
+    return postcodes | phones | {e.lower() for e in EMAIL_RE.findall(text)}
+
+def _names(tag):
+    names = tag.get("class") or []
+    if isinstance(names, str):
+        names = names.split()
+    if tag.get("id"):
+        names = list(names) + [tag["id"]]
+    return names
+
+def _is_content(tag):
+    return tag.name in CONTENT_TAGS or tag.get("role") == "main"
+
+def _kind(tag, in_content=False):
+    """
+    "drop", "contact" (keep contact details only) or None (content).
+    """
+    if tag.name in DROP_TAGS or tag.get("aria-hidden") == "true" or tag.get("role") == "navigation":
+        return "drop"
+    names = _names(tag)
+    if any(_DROP_NAMES_RE.search(n) for n in names):
+        return "drop"
+    if in_content:
+        return None
+    if tag.name in CONTACT_ONLY_TAGS or any(_CONTACT_ONLY_NAMES_RE.search(n) for n in names):
+        return "contact"
+    return None
+
+def _is_wrapper(tag, wrappers, min_size):
+    """
+    Whether `tag` wraps the page's content: it is one of `wrappers` (the
+    ancestors of <main>) or holds at least `min_size` characters of text.
+    """
+    if tag.name in OPAQUE_TAGS:
+        return False
+    if wrappers and id(tag) in wrappers:
+        return True
+    if min_size is None:
+        return False
+    size = 0
+    for text in tag.stripped_strings:
+        size += len(text) + 1
+        if size >= min_size:
+            return True
+    return False
+
+class _Enough(Exception):
+    pass
+
+def text_blocks(root, contact_only=False, skip=None, limit=None, wrappers=None, wrapper_size=None):
+    """
+    The text of `root` as a list of (block text, contact_only) pairs in page
+    order, with dropped elements and `skip` left out. Elements in `wrappers`
+    (ids) or holding `wrapper_size` characters of text are never dropped.
+    Stops early once the blocks hold more than `limit` characters.
+    """
+    blocks = []
+    parts = []
+    size = 0
+
+    def flush(contact):
+        nonlocal size
+        text = " ".join(" ".join(parts).split())
+        parts.clear()
+        if text:
+            blocks.append((text, contact))
+            size += len(text) + 1
+            if limit is not None and size > limit:
+                raise _Enough
+
+    def walk(node, contact, in_content):
+        for child in node.children:
+            if isinstance(child, NavigableString):
+                if not isinstance(child, PreformattedString):  # comments, CDATA, doctype
+                    parts.append(child)
+                continue
+            if not isinstance(child, Tag) or child is skip:
+                continue
+            kind = _kind(child, in_content)
+            if kind == "drop":
+                if not _is_wrapper(child, wrappers, wrapper_size):
+                    continue
+                kind = None
+            inner = (contact or kind == "contact") and child.name not in HEADING_TAGS
+            child_in_content = in_content or _is_content(child)
+            if child.name in BLOCK_TAGS or inner != contact:
+                flush(contact)
+                walk(child, inner, child_in_content)
+                flush(inner)
+            else:
+                walk(child, contact, child_in_content)
+
+    try:
+        walk(root, contact_only, _is_content(root))
+        flush(contact_only)
+    except _Enough:
+        pass
+    return blocks
+
+def main_text(soup, limit=MAX_TEXT):
+    """
+    The page's content as newline-separated blocks, boilerplate removed,
+    truncated to `limit` characters. With a <main> element, that comes first
+    and only contact details are taken from the rest of the page. Falls back
+    to the plain text when stripping leaves far less than the page holds.
+    """
+    body = soup.body or soup
+    main = soup.find("main") or soup.find(attrs={"role": "main"})
+    plain = (main or body).get_text(" ", strip=True)
+    wrapper_size = max(1, int(len(plain) * WRAPPER_SHARE))
+    try:
+        if main is not None:
+            wrappers = {id(parent) for parent in main.parents}
+            blocks = (text_blocks(main, limit=limit, wrapper_size=wrapper_size)
+                      + text_blocks(body, contact_only=True, skip=main, limit=limit, wrappers=wrappers))
+        else:
+            blocks = text_blocks(body, limit=limit, wrapper_size=wrapper_size)
+    except RecursionError:
+        # Pathologically deep markup; fall back to the plain text
+        return plain[:limit]
+
+    kept = []
+    seen = set()
+    for text, contact_only in blocks:
+        if contact_only and not has_contact_details(text):
+            continue
+        key = text.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(text)
+    text = "\n".join(kept)[:limit]
+    if len(text) < MIN_KEPT_SHARE * min(len(plain), limit):
+        return plain[:limit]
+    return text
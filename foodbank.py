@@ -1,22 +1,20 @@
-import requests
-from bs4 import BeautifulSoup
-import tldextract
-import time
-import openai
+import asyncio
 import os
-from dotenv import load_dotenv
+import sys
 import json, re
-import axios
+import functools
+import importlib.util
+from dataclasses import dataclass, field, replace
+from urllib.parse import urlsplit
+from urlnorm import absolute_url, canonical_url
 
-load_dotenv()
-
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-client = openai.Client(api_key=OPENAI_API_KEY)
+# Heavy dependencies (openai, httpx, bs4, tldextract, dotenv), and the stage
+# modules (llmcache, preclassify, structured_data, neardup), are imported
+# inside the functions that use them, so importing this module stays cheap
+# for workers, tests and notebooks. `python bench.py importtime` checks it.
 
 SEARCH_LOCATIONS = [
-    "Manchester UK", 
+    "Manchester UK",
     #"Birmingham UK",
     #"Leeds UK",
     #"Liverpool UK",
@@ -34,114 +32,449 @@ SEARCH_TERMS = [
     #"community pantry"
 ]
 
+# How many calls of each kind may be in flight at once
+SEARCH_CONCURRENCY = 4
+FETCH_CONCURRENCY = 16
+LLM_CONCURRENCY = 8
+
+# Seconds to wait for one OpenAI response (the SDK's own default). Completions
+# and batch file uploads/downloads can take minutes; pages get FETCH_TIMEOUT.
+LLM_TIMEOUT = 600.0
+FETCH_TIMEOUT = 10.0
+
+# Send model calls through the Batch API instead of one by one: "openai" for
+# real batches (half price, own quota, replies within 24h), "local" to run the
+# same batch files in-process. None calls the model interactively. See batch.py.
+LLM_BATCH = None
+
+MAX_SEARCH_PAGES = 3
+MAX_RESULTS_PER_TERM = 30
+# Stop paging through a query once a page's share of sites not seen before in
+# this run drops below this; later pages mostly repeat what we already have
+SEARCH_MIN_NOVELTY = 0.3
+MAX_DIRECTORY_LINKS = 5  # Limit to avoid too many requests per directory
+
+# One connection pool serves Serper, page fetches and OpenAI, so repeat calls to
+# the same host reuse a warm keep-alive connection instead of a new TLS handshake.
+# HTTP/2 is used where the server offers it, if the h2 package is installed.
+HTTP_POOL = {
+    "max_connections": 100,
+    "max_keepalive_connections": 40,
+    "keepalive_expiry": 30,
+    "max_per_host": 8,
+    "http2": True,
+}
+
+# Be nice: minimum gap between two requests to the same site. A longer
+# Crawl-delay from the site's robots.txt wins, up to MAX_CRAWL_DELAY.
+POLITENESS_DELAY = 2
+RESPECT_CRAWL_DELAY = True
+MAX_CRAWL_DELAY = 30
+
+CACHE_DIR = ".cache"
+
+# lxml builds the tree faster than the stdlib's html.parser, and a strained parse
+# of just the links much faster (`python bench.py parse`). html.parser is the
+# fallback when lxml is not installed.
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Decide obvious pages locally instead of asking classify_page (see preclassify.py).
+# A small share of local decisions is still sent to the model, so the label log
+# keeps measuring how often the local answer agrees.
+USE_PRECLASSIFIER = True
+PRECLASSIFY_AUDIT_RATE = 0.05
+
+# Keep fetched pages on disk between runs and revalidate them with
+# If-None-Match / If-Modified-Since (see httpcache.py)
+USE_HTTP_CACHE = True
+
+# Reuse search result pages for SEARCH_CACHE_TTL seconds across runs, and cap
+# the Serper credits one run may spend (None: no cap). See searchcache.py.
+USE_SEARCH_CACHE = True
+SEARCH_CACHE_TTL = 3 * 24 * 3600
+SEARCH_BUDGET = None
+
+# Reuse model replies for identical prompts across runs (see llmcache.py).
+# Bump a template's version whenever its prompt wording changes.
+USE_LLM_CACHE = True
+PROMPT_VERSIONS = {
+    "classify": 1,
+    "parse": 1,
+    "directory_urls": 1,
+    "directory_orgs": 1,
+    "classify_parse": 1,
+}
+
+# Reuse the model's answers for pages whose text is a near-duplicate (SimHash
+# within NEAR_DUP_DISTANCE bits) of a page already sent to it; see neardup.py.
+# Extractions are only reused when both pages show the same contact details.
+USE_NEAR_DUP = True
+NEAR_DUP_DISTANCE = 3  # of 64 bits
 
+# Merge the records of one food bank found on different pages (its own site,
+# its Facebook page, directory entries) once the crawl is done; see resolve.py
+RESOLVE_ENTITIES = True
 
-def google_search(query, page=1):
+# Classify and extract "single" pages in one schema-constrained model call
+# instead of classify_page followed by gpt_parse_foodbank
+COMBINED_LLM_CALL = False
+
+
+@dataclass
+class CrawlConfig:
+    """
+    Everything a crawl run can be tuned with. Defaults come from the module
+    constants above.
+    """
+    locations: list = field(default_factory=lambda: list(SEARCH_LOCATIONS))
+    terms: list = field(default_factory=lambda: list(SEARCH_TERMS))
+    search_concurrency: int = SEARCH_CONCURRENCY
+    fetch_concurrency: int = FETCH_CONCURRENCY
+    llm_concurrency: int = LLM_CONCURRENCY
+    llm_timeout: float = LLM_TIMEOUT
+    llm_batch: str = LLM_BATCH
+    batch_dir: str = os.path.join(CACHE_DIR, "batches")
+    max_search_pages: int = MAX_SEARCH_PAGES
+    max_results_per_term: int = MAX_RESULTS_PER_TERM
+    search_min_novelty: float = SEARCH_MIN_NOVELTY
+    max_directory_links: int = MAX_DIRECTORY_LINKS
+    politeness_delay: float = POLITENESS_DELAY
+    respect_crawl_delay: bool = RESPECT_CRAWL_DELAY
+    pool: dict = field(default_factory=lambda: dict(HTTP_POOL))
+    use_search_cache: bool = USE_SEARCH_CACHE
+    search_cache_path: str = os.path.join(CACHE_DIR, "search.sqlite")  # also holds the credit ledger
+    search_cache_ttl: float = SEARCH_CACHE_TTL
+    search_budget: int = SEARCH_BUDGET  # Serper credits per run
+    search_gl: str = None  # Serper country and language, e.g. "uk" and "en"
+    search_hl: str = None
+    use_http_cache: bool = USE_HTTP_CACHE
+    http_cache_dir: str = os.path.join(CACHE_DIR, "http")
+    use_llm_cache: bool = USE_LLM_CACHE
+    llm_cache_path: str = os.path.join(CACHE_DIR, "llm.sqlite")
+    output: str = None  # JSONL file to stream records to ("-" for stdout); None keeps them in memory
+    resolve_entities: bool = RESOLVE_ENTITIES
+    store_path: str = None  # SQLite file every record is also upserted into (see store.py)
+    run_id: str = None  # tags this run's rows in the credit ledger and result store; random when None
+    journal_path: str = None  # SQLite work journal; rerunning with the same one resumes (see journal.py)
+    use_preclassifier: bool = USE_PRECLASSIFIER
+    preclassify_audit_rate: float = PRECLASSIFY_AUDIT_RATE
+    classify_label_log: str = os.path.join(CACHE_DIR, "classify_labels.jsonl")  # features + model label, for tuning
+    combined_llm_call: bool = COMBINED_LLM_CALL
+    use_near_dup: bool = USE_NEAR_DUP
+    near_dup_distance: int = NEAR_DUP_DISTANCE
+
+
+async def google_search(http, query, page=1, gl=None, hl=None):
     url = "https://google.serper.dev/search"
-    headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
+    headers = {"X-API-KEY": os.getenv("SERPER_API_KEY"), "Content-Type": "application/json"}
     data = {"q": query, "page": page}
-    resp = requests.post(url, json=data, headers=headers)
+    if gl:
+        data["gl"] = gl
+    if hl:
+        data["hl"] = hl
+    resp = await http.post(url, json=data, headers=headers, timeout=FETCH_TIMEOUT)
     resp.raise_for_status()
     return resp.json().get("organic", [])
 
-def extract_main_content(url):
+@dataclass
+class Page:
+    """
+    One downloaded page: the raw bytes, the decoded HTML, the parsed tree and the
+    main text. Stages hand this along instead of downloading or parsing again.
+    """
+    url: str
+    status: int = None
+    content: bytes = b""
+    html: str = ""
+    soup: object = None  # bs4.BeautifulSoup
+    text: str = ""
+    error: str = None
+    fingerprint: int = None  # SimHash of text, set by the crawler when needed
+
+def extract_main_content(soup):
+    # Boilerplate (menus, cookie banners, footers) goes before truncating, so
+    # the prompt windows are spent on content; see boilerplate.py
+    from boilerplate import main_text
+
+    return main_text(soup, limit=9000)  # Truncate to stay under token limits for GPT-4.1-mini
+
+def parse_html(html, parse_only=None):
+    """
+    Parses a page with HTML_PARSER. `parse_only` (a bs4.SoupStrainer) keeps
+    just the matching elements, for passes that need only part of the tree.
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, HTML_PARSER, parse_only=parse_only)
+
+def parse_links(html):
+    """
+    A tree of just the page's <a href> elements.
+    """
+    from bs4 import SoupStrainer
+
+    return parse_html(html, SoupStrainer("a", href=True))
+
+async def fetch_page(http, url, cache=None):
     try:
-        resp = requests.get(url, timeout=10)
-        soup = BeautifulSoup(resp.text, "html.parser")
-        main = soup.find('main')
-        text = main.get_text(separator=" ", strip=True) if main else soup.get_text(" ", strip=True)
-        return text[:9000]  # Truncate to stay under token limits for GPT-4.1-mini
+        if cache is not None:
+            resp = await cache.get(http, url, timeout=FETCH_TIMEOUT)
+        else:
+            resp = await http.get(url, timeout=FETCH_TIMEOUT)
+        html = resp.text
+        soup = parse_html(html)
+        return Page(
+            url=url,
+            status=resp.status_code,
+            content=resp.content,
+            html=html,
+            soup=soup,
+            text=extract_main_content(soup),
+        )
     except Exception as e:
-        return f"Error fetching page: {e}"
-    
+        return Page(url=url, error=f"Error fetching page: {e}")
+
 def safe_json_extract(text):
+    """
+    Reads the first JSON object out of a free-text model reply, nested objects
+    and truncated replies included (see llm_schemas.read_json).
+    """
+    from llm_schemas import read_json
+
     try:
-        match = re.search(r"\{[\s\S]+?\}", text)
-        if match:
-            try:
-                parsed = json.loads(match.group(0))
-                # Handle cases where Opening Hours is an object instead of string
-                if "Opening Hours" in parsed and isinstance(parsed["Opening Hours"], dict):
-                    # Convert object to string representation
-                    hours_obj = parsed["Opening Hours"]
-                    hours_str = ", ".join([f"{day}: {time}" for day, time in hours_obj.items() if time])
-                    parsed["Opening Hours"] = hours_str
-                return parsed
-            except Exception as e:
-                return {"error": f"JSON decode failed: {e}", "raw": match.group(0)}
-        return {"error": "No JSON found", "raw": text}
+        parsed = read_json(text)
     except Exception as e:
-        return {"error": str(e), "raw": text}
+        return {"error": f"JSON decode failed: {e}", "raw": text}
+    # Handle cases where Opening Hours is an object instead of string
+    if "Opening Hours" in parsed and isinstance(parsed["Opening Hours"], dict):
+        hours_obj = parsed["Opening Hours"]
+        parsed["Opening Hours"] = ", ".join([f"{day}: {time}" for day, time in hours_obj.items() if time])
+    return parsed
+
+# Set for the length of a run by crawl(); see get_openai_client() for use outside one
+_openai_client = None
+_llm_cache = None
+_journal = None
+_llm_inflight = {}  # cache key -> task, so concurrent duplicates share one call
+_batch_queue = None
+
+def get_openai_client():
+    """
+    Returns the OpenAI client, creating a standalone one on first use.
+    """
+    global _openai_client
+    if _openai_client is None:
+        import openai
+
+        _openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT)
+    return _openai_client
+
+def get_llm_cache():
+    return _llm_cache
+
+def _chat_body(prompt, temperature, max_tokens, model, response_format=None):
+    body = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return body
+
+async def _create_completion(prompt, temperature, max_tokens, model, response_format=None):
+    body = _chat_body(prompt, temperature, max_tokens, model, response_format)
+    response = await get_openai_client().chat.completions.create(**body)
+    return response.choices[0].message.content
+
+async def complete(prompt, temperature, max_tokens, model="gpt-4.1-nano", template=None, response_format=None):
+    """
+    Sends a single-message chat completion and returns the reply text.
+    Replies are cached by template, prompt and parameters.
+    """
+    cache = get_llm_cache()
+    params = {"temperature": temperature, "max_tokens": max_tokens}
+    if response_format:
+        params["response_format"] = response_format
+    import llmcache
+
+    key = llmcache.make_key(model, template, PROMPT_VERSIONS.get(template), prompt, params)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    if _journal is not None:
+        replayed = _journal.llm_reply(key)
+        if replayed is not None:
+            return replayed
+    if key not in _llm_inflight:
+        if _batch_queue is not None:
+            # The cache key doubles as the batch custom_id
+            call = _batch_queue.submit(key, _chat_body(prompt, temperature, max_tokens, model, response_format))
+        else:
+            call = _create_completion(prompt, temperature, max_tokens, model, response_format)
+        _llm_inflight[key] = asyncio.ensure_future(call)
+    task = _llm_inflight[key]
+    try:
+        content = await asyncio.shield(task)
+    finally:
+        if task.done():
+            _llm_inflight.pop(key, None)
+    if content is not None:
+        if cache is not None:
+            cache.put(key, template, content)
+        if _journal is not None:
+            _journal.finish_llm_call(key, content)
+    return content
+
+PAGE_TYPES = ["single", "directory", "other"]
+
+CLASSIFY_INSTRUCTIONS = (
+    "Classify this webpage content as:\n"
+    "- 'single': about a specific food bank or pantry (even if it's a social media page, listing, or get-help page)\n"
+    "- 'directory': a list, directory, or guide of multiple food banks (even if it's just a few)\n"
+    "- 'other': not related to food banks\n\n"
+    "Be generous with 'directory' classification - if it mentions multiple food banks, lists services, or is a guide/resource page, classify as directory.\n"
+    "Be generous with 'single' classification - if it mentions a food bank name, service, or has 'get-help' in URL, classify as single.\n"
+    "Pages with 'get-help', 'find-a-foodbank', or specific food bank names should be 'single'.\n"
+)
 
-def classify_page(text):
+async def classify_page(text):
     """
     Uses GPT to classify whether the page is a single foodbank, a directory, or other.
     """
     prompt = (
-        "Classify this webpage content as:\n"
-        "- 'single': about a specific food bank or pantry (even if it's a social media page, listing, or get-help page)\n"
-        "- 'directory': a list, directory, or guide of multiple food banks (even if it's just a few)\n"
-        "- 'other': not related to food banks\n\n"
-        "Be generous with 'directory' classification - if it mentions multiple food banks, lists services, or is a guide/resource page, classify as directory.\n"
-        "Be generous with 'single' classification - if it mentions a food bank name, service, or has 'get-help' in URL, classify as single.\n"
-        "Pages with 'get-help', 'find-a-foodbank', or specific food bank names should be 'single'.\n"
+        CLASSIFY_INSTRUCTIONS +
         "Only return: single, directory, or other\n\n"
         f"CONTENT:\n{text[:3000]}"
     )
-    response = client.chat.completions.create(
-        model="gpt-4.1-nano",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0,
-        max_tokens=10
-    )
-    result = response.choices[0].message.content.strip().lower()
-    if result in {"single", "directory", "other"}:
+    content = await complete(prompt, temperature=0, max_tokens=10, template="classify")
+    result = content.strip().lower()
+    if result in PAGE_TYPES:
         return result
     return "other"
 
-def extract_foodbank_links_from_directory(html_content, base_url):
+async def classify_and_parse_page(text):
     """
-    Extract food bank links from directory pages using multiple methods
+    Classifies the page and, if it is a single food bank, extracts its details,
+    in one schema-constrained model call. Returns (classification, structured),
+    where structured is None unless the page is 'single', or (None, None) if
+    the reply could not be read.
+    """
+    from structured_data import RECORD_FIELDS
+
+    prompt = (
+        CLASSIFY_INSTRUCTIONS +
+        "Return a JSON object with 'page_type' set to single, directory, or other.\n"
+        "If page_type is 'single', also set 'foodbank' to the food bank's details "
+        f"({', '.join(RECORD_FIELDS)}), using null for anything missing; otherwise set 'foodbank' to null.\n\n"
+        f"CONTENT:\n{text[:6000]}"
+    )
+    from llm_schemas import FoodbankPage, parse_reply, response_format
+
+    content = await complete(
+        prompt, temperature=0, max_tokens=700, template="classify_parse",
+        response_format=response_format(FoodbankPage, "foodbank_page"),
+    )
+    try:
+        data = parse_reply(FoodbankPage, content)
+    except ValueError:  # includes pydantic's ValidationError
+        return None, None
+    classification = data["page_type"]
+    structured = data["foodbank"] if classification == "single" else None
+    return classification, structured
+
+def keyword_re(terms):
+    """
+    One case-insensitive alternation regex for a list of substrings, so a string
+    is checked against all of them in a single scan.
+    """
+    return re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.I)
+
+# Anchor href or text worth following from a directory page
+DIRECTORY_LINK_RE = keyword_re([
+    'foodbank', 'food bank', 'pantry', 'food pantry', 'food-bank',
+    'foodbank.org', 'foodbank.org.uk', 'trussell', 'turn2us',
+    'charity', 'community', 'support', 'help', 'assistance',
+    'manchester', 'central', 'south', 'north', 'east', 'west'
+])
+# Class of a list item / table cell / block whose links are all worth following
+DIRECTORY_CONTAINER_RE = keyword_re(['food', 'bank', 'pantry', 'charity', 'support', 'help'])
+DIRECTORY_CONTAINER_TAGS = {'li', 'td', 'div', 'p'}
+# Absolute links worth following when nothing above matched
+DIRECTORY_DOMAIN_RE = keyword_re([
+    'foodbank.org.uk', 'foodbank.org', 'trusselltrust.org',
+    'turn2us.org.uk', 'charitycommission.gov.uk',
+    'manchester', 'central', 'south', 'north'
+])
+# Final sanity filter on every candidate URL
+DIRECTORY_RESULT_RE = keyword_re(['foodbank', 'food-bank', 'pantry', 'food', 'charity', 'org', 'uk', 'manchester'])
+
+def _in_directory_container(tag, memo):
+    # Walks up to the first matching container, memoising every ancestor seen
+    # so sibling anchors in a long list stop after a step or two
+    seen = []
+    parent = tag.parent
+    found = False
+    while parent is not None:
+        key = id(parent)
+        if key in memo:
+            found = memo[key]
+            break
+        seen.append(key)
+        if parent.name in DIRECTORY_CONTAINER_TAGS and DIRECTORY_CONTAINER_RE.search(" ".join(parent.get("class") or ())):
+            found = True
+            break
+        parent = parent.parent
+    for key in seen:
+        memo[key] = found
+    return found
+
+def find_directory_links(soup, base_url):
+    """
+    Candidate food bank links on a directory page, from one pass over its anchors:
+    links whose href or text looks relevant, links inside food bank list items,
+    and failing both, absolute links to food bank looking domains.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
     links = []
-    
-    # Method 1: Direct HTML link extraction with broader terms
+    fallback = []
+    memo = {}
     for a in soup.find_all("a", href=True):
         href = a['href']
-        text = a.get_text(strip=True).lower()
-        
-        # Check if link text or href contains food bank related terms
-        foodbank_terms = [
-            'foodbank', 'food bank', 'pantry', 'food pantry', 'food-bank',
-            'foodbank.org', 'foodbank.org.uk', 'trussell', 'turn2us',
-            'charity', 'community', 'support', 'help', 'assistance',
-            'manchester', 'central', 'south', 'north', 'east', 'west'
-        ]
-        if any(term in href.lower() or term in text for term in foodbank_terms):
-            full_url = href if href.startswith('http') else base_url.rstrip('/') + '/' + href.lstrip('/')
-            links.append(full_url)
-    
-    # Method 2: Look for links in lists, tables, or structured content
-    for element in soup.find_all(['li', 'td', 'div', 'p'], class_=lambda x: x and any(term in x.lower() for term in ['food', 'bank', 'pantry', 'charity', 'support', 'help'])):
-        for a in element.find_all("a", href=True):
-            href = a['href']
-            full_url = href if href.startswith('http') else base_url.rstrip('/') + '/' + href.lstrip('/')
-            links.append(full_url)
-    
-    # Method 3: Extract all links and filter by domain patterns
-    if not links:
-        for a in soup.find_all("a", href=True):
-            href = a['href']
-            if href.startswith('http'):
-                # Look for food bank related domains
-                if any(domain in href.lower() for domain in [
-                    'foodbank.org.uk', 'foodbank.org', 'trusselltrust.org',
-                    'turn2us.org.uk', 'charitycommission.gov.uk',
-                    'manchester', 'central', 'south', 'north'
-                ]):
-                    links.append(href)
-    
+        if (DIRECTORY_LINK_RE.search(href) or DIRECTORY_LINK_RE.search(a.get_text(strip=True))
+                or _in_directory_container(a, memo)):
+            full_url = absolute_url(base_url, href)
+            if full_url:
+                links.append(full_url)
+        elif href.startswith('http') and DIRECTORY_DOMAIN_RE.search(href):
+            fallback.append(absolute_url(base_url, href))
+    return links or [link for link in fallback if link]
+
+def filter_directory_links(links):
+    """
+    Relevant links, one per canonical URL, in page order.
+    """
+    unique = {}
+    for link in links:
+        if DIRECTORY_RESULT_RE.search(link):
+            unique.setdefault(canonical_url(link), link)
+    return list(unique.values())
+
+async def extract_foodbank_links_from_directory(page):
+    """
+    Extract food bank links from directory pages using multiple methods
+    """
+    from batch import BatchRequestError
+
+    # Reuse the tree built at fetch time; a page that only has its HTML
+    # (e.g. loaded from disk) gets a links-only parse instead of a full one
+    soup = page.soup if page.soup is not None else parse_links(page.html)
+    html_content = page.html
+
+    # Methods 1-3: links, links in food bank lists, food bank domains
+    links = find_directory_links(soup, page.url)
+
     # Method 4: If still no links, try to extract from text using GPT
     if not links:
         try:
@@ -152,20 +485,16 @@ def extract_foodbank_links_from_directory(html_content, base_url):
                 "Return ONLY a JSON array of URLs, nothing else. If no URLs found, return [].\n\n"
                 f"TEXT:\n{html_content[:4000]}"
             )
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                max_tokens=400
-            )
-            content = response.choices[0].message.content
+            content = await complete(prompt, temperature=0, max_tokens=400, template="directory_urls")
             # Try to extract URLs from GPT response
             url_matches = re.findall(r'https?://[^\s"\']+', content)
             links.extend(url_matches)
+        except BatchRequestError:
+            raise  # retried on resume rather than taken as "no links"
         except Exception as e:
             print(f" GPT link extraction failed: {e}")
-    
-    
+
+
     # Method 5: Extract organization names and try to find their websites
     if not links:
         try:
@@ -175,13 +504,7 @@ def extract_foodbank_links_from_directory(html_content, base_url):
                 "Return ONLY a JSON array of organization names, nothing else.\n\n"
                 f"TEXT:\n{html_content[:3000]}"
             )
-            response = client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                max_tokens=300
-            )
-            content = response.choices[0].message.content
+            content = await complete(prompt, temperature=0, max_tokens=300, template="directory_orgs")
             # Try to extract organization names and construct potential URLs
             org_matches = re.findall(r'"([^"]+)"', content)
             for org in org_matches:
@@ -193,49 +516,629 @@ def extract_foodbank_links_from_directory(html_content, base_url):
                         f"https://www.{org.lower().replace(' ', '').replace('&', 'and')}.org.uk"
                     ]
                     links.extend(potential_urls)
+        except BatchRequestError:
+            raise  # retried on resume rather than taken as "no links"
         except Exception as e:
             print(f" Organization name extraction failed: {e}")
-    
-    # Remove duplicates and filter
-    unique_links = list(set(links))
-    filtered_links = []
-    for link in unique_links:
-        # Be more lenient with filtering
-        if any(term in link.lower() for term in ['foodbank', 'food-bank', 'pantry', 'food', 'charity', 'org', 'uk', 'manchester']):
-            filtered_links.append(link)
-    
-    return filtered_links
-
-
-def gpt_parse_foodbank(text):
+
+    return filter_directory_links(links)
+
+
+async def gpt_parse_foodbank(text, fields=None):
+    from batch import BatchRequestError
+    from llm_schemas import parse_reply, record_model, response_format
+    from structured_data import RECORD_FIELDS
+
+    if fields is None:
+        fields = RECORD_FIELDS
+    model = record_model(tuple(fields))
     try:
         prompt = (
             "Extract structured data about a UK food bank from the provided website text. "
             "Return ONLY a single JSON object with the following fields: "
-            "Name, Address, Postcode, Phone, Email, Opening Hours, Website, Any special requirements. "
+            f"{', '.join(fields)}. "
             "If any information is missing, use null. Do NOT include explanations, comments, or any extra text. "
             "Only return valid JSON and nothing else.\n\n"
             f"{text[:6000]}"
         )
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=600
+        content = await complete(
+            prompt, temperature=0.1, max_tokens=600, template="parse",
+            response_format=response_format(model, "foodbank"),
         )
-        content = response.choices[0].message.content
-        return safe_json_extract(content)
+    except BatchRequestError:
+        raise  # the crawler records it and leaves the page to be retried
     except Exception as e:
         return {"error": str(e)}
-    
-def domain_from_url(url):
-    ext = tldextract.extract(url)
+    try:
+        return parse_reply(model, content)
+    except ValueError as e:
+        return {"error": f"JSON decode failed: {e}", "raw": content}
+
+async def parse_foodbank_page(page, found=None):
+    """
+    Fills the record from the page's own structured data (JSON-LD, microdata,
+    tel:/mailto: links) and asks the model only for what is missing. Weaker
+    guesses (see fallback_fields) only fill what the model leaves empty.
+    """
+    from structured_data import RECORD_FIELDS, STRUCTURED_FIELDS, extract_structured_data, fallback_fields
+
+    if found is None:
+        found = extract_structured_data(page.soup)
+    fallback = fallback_fields(page.soup, page.url)
+    missing = [f for f in STRUCTURED_FIELDS if not found.get(f)]
+    if not missing:
+        return merge_structured(found, {}, fallback)
+    # Always ask for the requirements too, as only the model can read those
+    parsed = await gpt_parse_foodbank(page.text, fields=missing + RECORD_FIELDS[-1:])
+    if "error" in parsed:
+        return {**found, **parsed} if found else parsed
+    return merge_structured(found, parsed, fallback)
+
+def merge_structured(found, parsed, fallback=None):
+    """
+    One record from what the page itself said and what the model read from it;
+    the page's own structured data wins, and `fallback` guesses come last.
+    """
+    from structured_data import RECORD_FIELDS
+
+    fallback = fallback or {}
+    return {f: found.get(f) or parsed.get(f) or fallback.get(f) for f in RECORD_FIELDS}
+
+_tld_extract = None
+
+def get_tld_extract():
+    """
+    One shared TLDExtract that reads the Public Suffix List snapshot bundled
+    with tldextract: no download and no cache file, so a cold worker doesn't
+    stall on the network before its first result.
+    """
+    global _tld_extract
+    if _tld_extract is None:
+        import tldextract
+
+        _tld_extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    return _tld_extract
+
+@functools.lru_cache(maxsize=4096)
+def registered_domain(host):
+    ext = get_tld_extract()(host)
     return f"{ext.domain}.{ext.suffix}"
 
-results = []
+def domain_from_url(url):
+    # Memoised per host: search results and directories repeat the same sites
+    return registered_domain(urlsplit(url or "").hostname or "")
+
+async def fetch_crawl_delay(http, url):
+    """
+    Returns the Crawl-delay robots.txt asks of us for this URL's host, or None.
+    """
+    from urllib.robotparser import RobotFileParser
+
+    parts = urlsplit(url)
+    try:
+        resp = await http.get(f"{parts.scheme}://{parts.netloc}/robots.txt", timeout=FETCH_TIMEOUT)
+        if resp.status_code != 200:
+            return None
+        robots = RobotFileParser()
+        robots.parse(resp.text.splitlines())
+        delay = robots.crawl_delay("*")
+        return float(delay) if delay is not None else None
+    except Exception:
+        return None
+
+
+class HostScheduler:
+    """
+    Spaces requests to the same site at least `delay` seconds apart while
+    requests to different sites go ahead in parallel. Sites are keyed by
+    domain_from_url, so subdomains of one site share a slot.
+    """
+
+    def __init__(self, http, delay=POLITENESS_DELAY, respect_crawl_delay=RESPECT_CRAWL_DELAY):
+        self.http = http
+        self.delay = delay
+        self.respect_crawl_delay = respect_crawl_delay
+        self._next_slot = {}  # domain -> loop time the next request may start
+        self._crawl_delays = {}  # domain -> task resolving to that site's delay
+
+    async def host_delay(self, url):
+        if not self.respect_crawl_delay:
+            return self.delay
+        domain = domain_from_url(url)
+        if domain not in self._crawl_delays:
+            self._crawl_delays[domain] = asyncio.ensure_future(self._lookup_delay(url))
+        return await self._crawl_delays[domain]
+
+    async def _lookup_delay(self, url):
+        # Fetching robots.txt is itself a request to the site
+        await self._reserve(url, self.delay)
+        crawl_delay = await fetch_crawl_delay(self.http, url)
+        if crawl_delay is None:
+            return self.delay
+        return max(self.delay, min(crawl_delay, MAX_CRAWL_DELAY))
+
+    async def _reserve(self, url, delay):
+        # Claim the next free slot for the site before sleeping, so concurrent
+        # callers queue up behind each other instead of all waking at once
+        domain = domain_from_url(url)
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next_slot.get(domain, now))
+        self._next_slot[domain] = start + delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def wait(self, url):
+        """
+        Returns once it is polite to send a request to `url`.
+        """
+        delay = await self.host_delay(url)
+        await self._reserve(url, delay)
+
+
+def dedupe_key(record):
+    """
+    A record is written once per page; records of the same food bank from
+    different pages are merged later, by resolve.resolve().
+    """
+    return canonical_url(record["url"]) if record.get("url") else None
+
+def read_records(path):
+    """
+    The records in a JSONL output file, skipping any line cut short by a crash.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def write_records(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def is_error_record(record):
+    structured = record.get("structured")
+    return not isinstance(structured, dict) or bool(structured.get("error"))
+
+class RecordSink:
+    """
+    Takes records as soon as they are produced and drops pages already seen.
+    With a path, each record is appended to a JSONL file and flushed straight
+    away, so a crash loses nothing and only the dedupe keys stay in memory.
+    An existing file is appended to and its keys are loaded first. Without a
+    path, records are collected in `records`. A page whose record was an
+    error (e.g. a failed fetch or model call) may be written again, so a retry
+    that works still gets into the output. Every record is also upserted into
+    `store` (a store.ResultStore) when there is one, unless it is an error for
+    a page the store already has a good record for.
+    """
+
+    def __init__(self, path=None, store=None):
+        self.store = store
+        self.keys = {}  # dedupe key -> whether its record was an error
+        self.records = []
+        self.written = 0
+        self.duplicates = 0
+        self.file = None
+        if path == "-":
+            self.file = sys.stdout
+        elif path:
+            if os.path.exists(path):
+                for record in read_records(path):
+                    try:
+                        key = dedupe_key(record)
+                        self.keys[key] = self.keys.get(key, True) and is_error_record(record)
+                    except (KeyError, TypeError, AttributeError):
+                        continue
+            self.file = open(path, "a", encoding="utf-8")
+
+    def add(self, record):
+        key = dedupe_key(record)
+        failed = is_error_record(record)
+        if self.store is not None and not (failed and self.keys.get(key) is False):
+            self.store.add(record)  # a page seen before may have changed
+        if not key or (key in self.keys and (failed or not self.keys[key])):
+            self.duplicates += 1
+            return False
+        self.keys[key] = failed
+        self.written += 1
+        if self.file is None:
+            self.records.append(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+        return True
+
+    def close(self):
+        if self.file is not None and self.file is not sys.stdout:
+            self.file.close()
+        if self.store is not None:
+            self.store.close()
+
+
+class Crawler:
+    """
+    Runs the search -> fetch -> classify -> parse pipeline for every location and
+    term at once. Each stage has its own semaphore, so a slow model call never
+    holds up page downloads and vice versa.
+    """
+
+    def __init__(self, http, config, sink, journal=None):
+        self.http = http
+        self.config = config
+        self.sink = sink
+        self.journal = journal
+        self.scheduler = HostScheduler(http, config.politeness_delay, config.respect_crawl_delay)
+        self.search_slots = asyncio.Semaphore(config.search_concurrency)
+        self.fetch_slots = asyncio.Semaphore(config.fetch_concurrency)
+        if config.llm_batch:
+            from batch import BATCH_MAX_REQUESTS
+
+            # Waiting calls are what fills a batch, so let a whole batch's worth wait
+            self.llm_slots = asyncio.Semaphore(BATCH_MAX_REQUESTS)
+        else:
+            self.llm_slots = asyncio.Semaphore(config.llm_concurrency)
+        self.fetched = set()  # canonical URLs already claimed this run (see urlnorm.py)
+        self.search_sites = set()  # registered domains seen in search results this run
+        self.stats = {"preclassified": 0, "model_classified": 0, "combined": 0, "structured_only": 0, "model_parse": 0,
+                      "near_dup_classified": 0, "near_dup_parsed": 0}
+        self.near_dups = None
+        if config.use_near_dup:
+            from neardup import SimHashIndex
+
+            self.near_dups = SimHashIndex(config.near_dup_distance)
+        self.http_cache = None
+        if config.use_http_cache:
+            from httpcache import HttpCache
+
+            self.http_cache = HttpCache(config.http_cache_dir)
+        from searchcache import QuotaLedger, SearchCache
+
+        self.search_cache = None
+        if config.use_search_cache:
+            self.search_cache = SearchCache(config.search_cache_path, config.search_cache_ttl)
+        self.quota = QuotaLedger(config.search_cache_path, config.search_budget, config.run_id)
+
+    def close(self):
+        if self.search_cache is not None:
+            self.search_cache.close()
+        self.quota.close()
+
+    async def search_page(self, query, page):
+        """
+        One page of results: from the journal, the search cache, or Serper, in
+        that order. Returns None once the run's search budget is spent.
+        """
+        gl, hl = self.config.search_gl, self.config.search_hl
+        page_results = self.journal.search_page(query, page) if self.journal else None
+        if page_results is None and self.search_cache is not None:
+            page_results = self.search_cache.get(query, page, gl, hl)
+        if page_results is None:
+            if not self.quota.reserve():
+                return None
+            try:
+                async with self.search_slots:
+                    page_results = await google_search(self.http, query, page=page, gl=gl, hl=hl)
+            except Exception:
+                self.quota.release()
+                raise
+            self.quota.record(query, page)
+            if self.search_cache is not None:
+                self.search_cache.put(query, page, page_results, gl, hl)
+        if self.journal:
+            self.journal.finish_search_page(query, page, page_results)
+        return page_results
+
+    async def search(self, query, found=None, limit=None):
+        """
+        Pages through the results for `query`, adding them to `found` (canonical
+        URL -> result). Stops at an empty page, once `found` holds `limit`
+        results, or when a page adds too few sites this run hasn't seen.
+        """
+        print(f"Searching: {query}")
+        found = {} if found is None else found
+        # Each page decides whether the next one is worth buying, so they stay sequential
+        for page in range(1, self.config.max_search_pages + 1):
+            try:
+                page_results = await self.search_page(query, page)
+                if page_results is None:
+                    print(f" Search budget of {self.quota.budget} credits spent; stopping {query} at page {page}")
+                    break
+                links = [res["link"] for res in page_results if res.get("link")]
+                new_sites = {domain_from_url(link) for link in links} - self.search_sites
+                self.search_sites |= new_sites
+                for res in page_results:
+                    if res.get("link"):
+                        found.setdefault(canonical_url(res["link"]), res)
+                print(f" {query} page {page}: {len(page_results)} results, {len(new_sites)} new sites")
+                if len(page_results) == 0:
+                    break  # No more results
+                if limit is not None and len(found) >= limit:
+                    break  # Enough for what will be processed
+                if len(new_sites) < self.config.search_min_novelty * len(links):
+                    print(f" {query}: page {page} added few new sites, not paging further")
+                    break
+            except Exception as e:
+                print(f" Error on page {page} of {query}: {e}")
+                break
+        return found
+
+    def claim(self, url):
+        """
+        Returns True the first time a page is seen this run, False afterwards,
+        whichever variant of its URL (http/https, www., trailing slash,
+        tracking parameters) turns up.
+        """
+        key = canonical_url(url)
+        if key in self.fetched:
+            return False
+        self.fetched.add(key)
+        if self.journal and self.journal.url_done(key):
+            return False  # Finished by an earlier run
+        return True
+
+    async def fetch(self, url):
+        # A fresh cached copy costs the site nothing, so it skips the queue
+        if self.http_cache is None or not self.http_cache.is_fresh(url):
+            await self.scheduler.wait(url)
+        async with self.fetch_slots:
+            return await fetch_page(self.http, url, cache=self.http_cache)
+
+    async def classify(self, page):
+        """
+        Returns (classification, structured). structured is already filled in
+        when the combined call classified the page as 'single', else None.
+        """
+        from structured_data import STRUCTURED_FIELDS, extract_structured_data, fallback_fields
+
+        features = None
+        weight = 1
+        if self.config.use_preclassifier:
+            import random
+            from preclassify import page_features, preclassify
+
+            features = page_features(page)
+            label = preclassify(features)
+            if label is not None:
+                if random.random() >= self.config.preclassify_audit_rate:
+                    self.stats["preclassified"] += 1
+                    return label, None
+                # An audited page stands for the 1/rate pages decided like it
+                weight = 1 / self.config.preclassify_audit_rate
+        earlier = await self.near_duplicate(page, "label")
+        if earlier is not None:
+            self.stats["near_dup_classified"] += 1
+            if features is not None and self.config.classify_label_log:
+                self.log_label(page.url, features, earlier["label"], weight)
+            structured = self.reuse_record(page, earlier) if earlier["label"] == "single" else None
+            return earlier["label"], structured
+        label, structured = None, None
+        try:
+            found = extract_structured_data(page.soup) if self.config.combined_llm_call else {}
+            if self.config.combined_llm_call and not all(found.get(f) for f in STRUCTURED_FIELDS):
+                async with self.llm_slots:
+                    label, parsed = await classify_and_parse_page(page.text)
+                if parsed is not None:
+                    structured = merge_structured(found, parsed, fallback_fields(page.soup, page.url))
+                    self.stats["combined"] += 1
+            if label is None:
+                # Combined mode off, not needed, or its reply was unusable
+                async with self.llm_slots:
+                    label = await classify_page(page.text)
+        finally:
+            self.remember(page, "label", label)
+        if structured is not None:
+            self.remember(page, "record", structured)
+        self.stats["model_classified"] += 1
+        if features is not None and self.config.classify_label_log:
+            self.log_label(page.url, features, label, weight)
+        return label, structured
+
+    async def near_duplicate(self, page, answer):
+        """
+        Returns the entry of the nearest earlier page with the same text, give
+        or take a few words, or None. Entries hold the model's "label" and
+        "record" for that page. If the model is still working out `answer` for
+        it, waits first, so concurrent copies of a page cost one call. When
+        there is no answer to reuse, this page is marked as getting one; call
+        remember() with it afterwards, even on failure.
+        """
+        if self.near_dups is None:
+            return None
+        if page.fingerprint is None:
+            from neardup import simhash
+
+            page.fingerprint = simhash(page.text)
+        if page.fingerprint is None:
+            return None  # Too little text to compare
+        match = self.near_dups.find(page.fingerprint)
+        earlier = match[1] if match else None
+        if earlier is not None:
+            pending = earlier["pending"].get(answer)
+            if pending is not None:
+                await pending.wait()
+            if earlier.get(answer) is not None:
+                return earlier
+        own = self.near_dups.values.get(page.fingerprint)
+        if own is None:
+            own = {"pending": {}}
+            self.near_dups.add(page.fingerprint, own)
+        own["pending"].setdefault(answer, asyncio.Event())
+        return earlier
+
+    def remember(self, page, answer, value):
+        if self.near_dups is None or page.fingerprint is None:
+            return
+        entry = self.near_dups.values.get(page.fingerprint)
+        if entry is None:
+            entry = {"pending": {}}
+            self.near_dups.add(page.fingerprint, entry)
+        if value is not None and "error" not in value:
+            entry[answer] = value
+            if answer == "record":
+                from boilerplate import contact_details
 
-for location in SEARCH_LOCATIONS:
-    for term in SEARCH_TERMS:
+                entry["contacts"] = contact_details(page.text)
+        pending = entry["pending"].pop(answer, None)
+        if pending is not None:
+            pending.set()
+
+    def reuse_record(self, page, earlier, found=None):
+        """
+        The earlier page's record, if it showed the same contact details, with
+        this page's own structured data on top. None otherwise.
+        """
+        from boilerplate import contact_details
+        from structured_data import extract_structured_data, fallback_fields
+
+        # Templated sites share most of their text but not their address
+        if not earlier.get("record") or not earlier.get("contacts") or earlier["contacts"] != contact_details(page.text):
+            return None
+        if found is None:
+            found = extract_structured_data(page.soup)
+        return merge_structured(found, earlier["record"], fallback_fields(page.soup, page.url))
+
+    def log_label(self, url, features, label, weight=1):
+        path = self.config.classify_label_log
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"url": url, "features": features, "label": label, "weight": weight}) + "\n")
+
+    async def parse(self, page):
+        from structured_data import STRUCTURED_FIELDS, extract_structured_data
+
+        found = extract_structured_data(page.soup)
+        if all(found.get(f) for f in STRUCTURED_FIELDS):
+            # Nothing for the model to add, so don't take an LLM slot
+            self.stats["structured_only"] += 1
+            return await parse_foodbank_page(page, found)
+        earlier = await self.near_duplicate(page, "record")
+        record = self.reuse_record(page, earlier, found) if earlier is not None else None
+        if record is not None:
+            self.stats["near_dup_parsed"] += 1
+            return record
+        self.stats["model_parse"] += 1
+        try:
+            async with self.llm_slots:
+                record = await parse_foodbank_page(page, found)
+        finally:
+            self.remember(page, "record", record)
+        return record
+
+    async def directory_links(self, page):
+        async with self.llm_slots:
+            return await extract_foodbank_links_from_directory(page)
+
+    async def process_directory_link(self, fb_url, location):
+        """
+        Returns False if the page failed and should be tried again.
+        """
+        if not self.claim(fb_url):
+            print(f"    Already done: {fb_url}")
+            return True
+        print(f"    Processing: {fb_url}")
+        try:
+            fb_page = await self.fetch(fb_url)
+            if fb_page.error or not fb_page.text:
+                return True
+            fb_structured = await self.parse(fb_page)
+        except Exception as e:
+            # Left unfinished in the journal, so a resumed run tries it again
+            print(f"    Failed: {fb_url}: {e}")
+            self.sink.add({
+                "name": fb_url,
+                "url": fb_url,
+                "domain": domain_from_url(fb_url),
+                "location": location,
+                "structured": {"error": str(e)},
+            })
+            return False
+        self.sink.add({
+            "name": fb_url,
+            "url": fb_url,
+            "domain": domain_from_url(fb_url),
+            "location": location,
+            "structured": fb_structured,
+        })
+        if self.journal:
+            self.journal.finish_url(canonical_url(fb_url), "single")
+        return True
+
+    async def scrape_result(self, url, location):
+        """
+        Fetches and classifies one search result, following it if it is a
+        directory. Returns (classification, structured, finished), where
+        finished is False when some of a directory's links failed, so that
+        a resumed run follows it again.
+        """
+        page = await self.fetch(url)
+        if page.error:
+            return "error", {"error": page.error}, True
+        classification, single_structured = await self.classify(page)
+        print(f"  {url} classified as: {classification}")
+        if classification == "directory":
+            # Extract individual links and process them
+            print(f" Directory page: extracting links from {url}")
+            foodbank_links = await self.directory_links(page)
+            print(f"  Found {len(foodbank_links)} food bank links on {url}")
+
+            # Links already claimed elsewhere don't use up this directory's budget
+            fresh = [u for u in foodbank_links if canonical_url(u) not in self.fetched]
+            done = await asyncio.gather(*(
+                self.process_directory_link(fb_url, location)
+                for fb_url in fresh[:self.config.max_directory_links]
+            ))
+
+            structured = {"error": f"Directory page processed, extracted {len(foodbank_links)} links"}
+            return classification, structured, all(done)
+        if classification != "single":
+            return classification, {"error": f"Skipped page classified as '{classification}'"}, True
+        if single_structured is not None:
+            return classification, single_structured, True
+        return classification, await self.parse(page), True
+
+    async def process_result(self, res, location):
+        """
+        Sends the records for one search result to the sink: any food banks found
+        through a directory page, then the record for the result itself.
+        """
+        url = res.get("link")
+        name = res.get("title")
+        domain = domain_from_url(url)
+        if not self.claim(url):
+            # Same URL from another query, a directory or an earlier run
+            print(f" Already done: {url}")
+            return
+        print(f" Scraping {url} ({name})")
+        try:
+            classification, structured, finished = await self.scrape_result(url, location)
+        except Exception as e:
+            # One bad page mustn't stop the crawl. The URL is left unfinished
+            # in the journal, so a resumed run tries it again.
+            print(f"  Failed: {url}: {e}")
+            self.sink.add({
+                "name": name,
+                "url": url,
+                "domain": domain,
+                "location": location,
+                "structured": {"error": str(e)},
+            })
+            return
+        self.sink.add({
+            "name": name,
+            "url": url,
+            "domain": domain,
+            "location": location,
+            "structured": structured,
+        })
+        if self.journal and finished:
+            # Only after the record (and any directory children) are written
+            self.journal.finish_url(canonical_url(url), classification)
+
+    async def crawl_term(self, location, term):
         # Try different search strategies for each term
         search_queries = [
             f"{term} {location} -Trussell",
@@ -243,92 +1146,214 @@ for location in SEARCH_LOCATIONS:
             # f"{term} near {location}",
             # f"community {term} {location}"
         ]
-        
-        all_search_results = []
-        
+        # One result per page, so variants don't use up max_results_per_term.
+        # Queries run in turn so later ones only fetch what's still wanted.
+        limit = self.config.max_results_per_term
+        found = {}
         for query in search_queries:
-            print(f"Searching: {query}")
-            
-            # Get results from multiple pages
-            for page in range(1, 4):  # Try pages 1, 2, 3
-                try:
-                    page_results = google_search(query, page=page)
-                    all_search_results.extend(page_results)
-                    print(f" Page {page}: {len(page_results)} results")
-                    if len(page_results) == 0:
-                        break  # No more results
-                except Exception as e:
-                    print(f" Error on page {page}: {e}")
-                    break
-        
-        print(f" Total: {len(all_search_results)} search results")
-        for res in all_search_results[:30]:  # Process up to 30 results
-            url = res.get("link")
-            name = res.get("title")
-            domain = domain_from_url(url)
-            print(f" Scraping {url} ({name})")
-            main_text = extract_main_content(url)
-            if main_text.startswith("Error"):
-                structured = {"error": main_text}
-            else:
-                classification = classify_page(main_text)
-                print(f"  Classified as: {classification}")
-                if classification == "directory":
-                    # Extract individual links and process them
-                    print(f" Directory page: extracting links from {url}")
-                    # Get the HTML content for better link extraction
-                    try:
-                        resp = requests.get(url, timeout=10)
-                        html_content = resp.text
-                    except Exception as e:
-                        html_content = main_text
-                    
-                    foodbank_links = extract_foodbank_links_from_directory(html_content, url)
-                    print(f"  Found {len(foodbank_links)} food bank links")
-                    
-                    for fb_url in foodbank_links[:5]:  # Limit to 5 to avoid too many requests
-                        print(f"    Processing: {fb_url}")
-                        fb_main_text = extract_main_content(fb_url)
-                        if fb_main_text and not fb_main_text.startswith("Error"):
-                            fb_structured = gpt_parse_foodbank(fb_main_text)
-                            # Save as another record
-                            results.append({
-                                "name": fb_url,
-                                "url": fb_url,
-                                "domain": domain_from_url(fb_url),
-                                "location": location,
-                                "structured": fb_structured,
-                            })
-                        time.sleep(1)  # Be nice to individual food bank sites
-                    
-                    structured = {"error": f"Directory page processed, extracted {len(foodbank_links)} links"}
-                elif classification != "single":
-                    structured = {"error": f"Skipped page classified as '{classification}'"}
-                else:
-                    structured = gpt_parse_foodbank(main_text)
-            record = {
-                "name": name,
-                "url": url,
-                "domain": domain,
-                "location": location,
-                "structured": structured,
-            }
-            results.append(record)
-            time.sleep(2)  # Be nice!
-
-# Deduplicate: By (Address if found) else by domain
-unique = {}
-for r in results:
-    addr = None
+            if len(found) >= limit:
+                break
+            await self.search(query, found, limit)
+        all_search_results = list(found.values())
+
+        print(f" Total for {term} {location}: {len(all_search_results)} search results")
+        await asyncio.gather(*(
+            self.process_result(res, location)
+            for res in all_search_results[:limit]
+        ))
+
+    async def run(self, locations, terms):
+        await asyncio.gather(*(
+            self.crawl_term(location, term)
+            for location in locations
+            for term in terms
+        ))
+
+
+async def _respond_locally(body):
+    # Local batch stand-in: answers one batch request with an interactive call
+    return await _create_completion(
+        body["messages"][0]["content"], body["temperature"], body["max_tokens"], body["model"],
+        body.get("response_format"),
+    )
+
+def make_batch_queue(mode, directory):
+    from batch import BatchQueue, LocalBatchRunner, OpenAIBatchRunner
+
+    if mode == "openai":
+        runner = OpenAIBatchRunner(get_openai_client())
+    elif mode == "local":
+        runner = LocalBatchRunner(_respond_locally)
+    else:
+        raise ValueError(f"unknown batch mode: {mode!r}")
+    return BatchQueue(runner, directory)
+
+async def crawl(config, sink):
+    import openai
+    from httppool import make_http_client
+
+    global _openai_client, _llm_cache, _journal, _batch_queue
+    async with make_http_client(config.pool) as http:
+        # An explicit timeout, or the SDK takes the pool's default
+        _openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http,
+                                            timeout=config.llm_timeout)
+        if config.llm_batch:
+            _batch_queue = make_batch_queue(config.llm_batch, config.batch_dir)
+        _llm_cache = None
+        if config.use_llm_cache:
+            from llmcache import LLMCache
+
+            _llm_cache = LLMCache(config.llm_cache_path)
+        if config.journal_path:
+            from journal import Journal
+
+            _journal = Journal(config.journal_path)
+        crawler = None
+        try:
+            crawler = Crawler(http, config, sink, _journal)
+            await crawler.run(config.locations, config.terms)
+            print(f"Records: {sink.written} written, {sink.duplicates} duplicates dropped")
+            if sink.store is not None:
+                print(f"Result store: {sink.store.summary()}")
+            print(f"Classifying: {crawler.stats['preclassified']} pages decided locally, "
+                  f"{crawler.stats['model_classified']} by the model, "
+                  f"{crawler.stats['near_dup_classified']} as near-duplicates")
+            print(f"Parsing: {crawler.stats['structured_only']} pages from structured data alone, "
+                  f"{crawler.stats['model_parse']} needed the model, "
+                  f"{crawler.stats['combined']} extracted with their classification, "
+                  f"{crawler.stats['near_dup_parsed']} reused from near-duplicates")
+            if crawler.search_cache is not None:
+                print(f"Search cache: {crawler.search_cache.stats}")
+            print(f"Search quota: {crawler.quota.summary()}")
+            if crawler.http_cache is not None:
+                print(f"HTTP cache: {crawler.http_cache.stats}")
+            if _batch_queue is not None:
+                print(f"LLM batches: {_batch_queue.stats}")
+            if _llm_cache is not None:
+                print(f"LLM cache: {_llm_cache.summary()}")
+            if _journal is not None:
+                print(f"Journal: {_journal.stats}")
+        finally:
+            if crawler is not None:
+                crawler.close()
+            if _batch_queue is not None:
+                await _batch_queue.close()
+            # Both are tied to this run's connection pool and event loop
+            if _llm_cache is not None:
+                _llm_cache.close()
+            if _journal is not None:
+                _journal.close()
+            _openai_client = None
+            _llm_cache = None
+            _journal = None
+            _batch_queue = None
+            _llm_inflight.clear()
+
+def entities_path(output):
+    # foodbanks.jsonl -> foodbanks.resolved.jsonl
+    root, ext = os.path.splitext(output)
+    return f"{root}.resolved{ext or '.jsonl'}"
+
+def resolve_records(records):
+    from resolve import resolve
+
+    return resolve(records, domain_from_url)
+
+def run_crawl(config=None):
+    """
+    Runs a full crawl. Page records are streamed to config.output when it is
+    set, and the food banks resolved from the whole file are written next to it
+    (see entities_path()). Returns the resolved food banks; nothing when
+    streaming to stdout.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    config = config or CrawlConfig()
+    if config.journal_path and config.output in (None, "-"):
+        raise ValueError("resuming from a journal needs an output file to append to")
+    if config.run_id is None:
+        import uuid
+
+        config = replace(config, run_id=uuid.uuid4().hex)
+    store = None
+    if config.store_path:
+        from store import ResultStore
+
+        store = ResultStore(config.store_path, config.run_id)
+    sink = RecordSink(config.output, store)
     try:
-        addr = (r["structured"].get("Address") or "").strip().lower()
-    except:
-        pass
-    key = addr if addr else r["domain"]
-    if key and key not in unique:
-        unique[key] = r
+        asyncio.run(crawl(config, sink))
+    finally:
+        sink.close()
+    if config.output == "-" or not config.resolve_entities:
+        return sink.records
+    if config.output is None:
+        return resolve_records(sink.records)
+    records = list(read_records(config.output))
+    foodbanks = resolve_records(records)
+    path = entities_path(config.output)
+    write_records(path, foodbanks)
+    print(f"Resolved {len(records)} records in {config.output} to {len(foodbanks)} food banks in {path}")
+    return foodbanks
+
+DEFAULT_OUTPUT = "foodbanks.jsonl"
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find and extract UK food bank details.")
+    parser.add_argument("--location", action="append", dest="locations",
+                        help=f"location to search, repeatable (default: {', '.join(SEARCH_LOCATIONS)})")
+    parser.add_argument("--term", action="append", dest="terms",
+                        help=f"search term, repeatable (default: {', '.join(SEARCH_TERMS)})")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help=f"JSONL file records are appended to as they are found, '-' for stdout (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--no-resolve", action="store_true",
+                        help="don't merge the records into one per food bank after the crawl")
+    parser.add_argument("--store", metavar="PATH",
+                        help="also upsert every record into this SQLite file, indexed by URL, domain, postcode and run")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="record finished work in this SQLite file; rerun with the same file to resume")
+    parser.add_argument("--fetch-concurrency", type=int, default=FETCH_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument("--politeness-delay", type=float, default=POLITENESS_DELAY,
+                        help="seconds between requests to the same site")
+    parser.add_argument("--search-budget", type=int, default=SEARCH_BUDGET, metavar="CREDITS",
+                        help="stop searching once this run has spent this many Serper credits")
+    parser.add_argument("--no-search-cache", action="store_true", help="always query Serper")
+    parser.add_argument("--batch", choices=["openai", "local"], default=LLM_BATCH,
+                        help="send model calls as batch files: through the OpenAI Batch API, or run locally")
+    parser.add_argument("--no-http-cache", action="store_true", help="always download pages")
+    parser.add_argument("--no-llm-cache", action="store_true", help="always call the model")
+    parser.add_argument("--combined", action="store_true",
+                        help="classify and extract single pages in one model call")
+    parser.add_argument("--no-preclassify", action="store_true", help="send every page to the model classifier")
+    args = parser.parse_args(argv)
+
+    config = CrawlConfig(
+        output=args.output,
+        journal_path=args.journal,
+        resolve_entities=not args.no_resolve,
+        store_path=args.store,
+        fetch_concurrency=args.fetch_concurrency,
+        llm_concurrency=args.llm_concurrency,
+        politeness_delay=args.politeness_delay,
+        search_budget=args.search_budget,
+        llm_batch=args.batch,
+        use_search_cache=not args.no_search_cache,
+        use_http_cache=not args.no_http_cache,
+        use_llm_cache=not args.no_llm_cache,
+        use_preclassifier=not args.no_preclassify,
+        combined_llm_call=args.combined,
+    )
+    if args.locations:
+        config.locations = args.locations
+    if args.terms:
+        config.terms = args.terms
+
+    run_crawl(config)
 
-foodbanks = list(unique.values())
 
-for fb in foodbanks:
-    print(json.dumps(fb, indent=2, ensure_ascii=False))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+On-disk HTTP cache for page fetches.
+
+Bodies are stored once per content hash under objects/, so mirrors and
+unchanged pages share one file. A small JSON entry per URL under index/ holds
+the headers, the body hash and when the entry expires. Fresh entries are served
+without touching the network. Stale ones are revalidated with If-None-Match /
+If-Modified-Since, and a 304 costs only the headers.
+"""
+import hashlib
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+HTTP_CACHE_DIR = os.path.join(".cache", "http")
+
+# Headers that describe the wire encoding rather than the page. The body is
+# stored decoded, so these must not be replayed on a cached response.
+_WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _parse_cache_control(value):
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def freshness_lifetime(headers, default_max_age=0):
+    """
+    Seconds a response may be served without revalidating, from Cache-Control
+    max-age or Expires. Returns None when the response must not be stored.
+    """
+    cc = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return 0
+    if "max-age" in cc:
+        try:
+            return max(0, int(cc["max-age"]))
+        except ValueError:
+            return 0
+    expires = _http_date(headers.get("expires"))
+    if expires is not None:
+        date = _http_date(headers.get("date")) or time.time()
+        return max(0, expires - date)
+    return default_max_age
+
+
+class HttpCache:
+    """
+    Wraps GET requests on an httpx.AsyncClient with a persistent cache.
+    `default_max_age` applies to responses that carry no freshness headers;
+    the default of 0 means they are always revalidated.
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR, default_max_age=0):
+        self.directory = directory
+        self.default_max_age = default_max_age
+        self.stats = {"fresh": 0, "revalidated": 0, "stale_on_error": 0, "miss": 0}
+
+    def _index_path(self, url):
+        key = _sha256(url.encode("utf-8"))
+        return os.path.join(self.directory, "index", key[:2], key + ".json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _write(self, path, data):
+        # Write then rename so a crash never leaves a half-written file behind
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def load(self, url):
+        try:
+            with open(self._index_path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+            with open(self._object_path(entry["body"]), "rb") as f:
+                return entry, f.read()
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def is_fresh(self, url):
+        try:
+            with open(self._index_path(url), encoding="utf-8") as f:
+                return json.load(f)["expires_at"] > time.time()
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def store(self, url, response):
+        lifetime = freshness_lifetime(response.headers, self.default_max_age)
+        if lifetime is None:
+            return
+        body = response.content
+        digest = _sha256(body)
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            self._write(object_path, body)
+        entry = {
+            "url": str(response.url),
+            "status": response.status_code,
+            "headers": [(k, v) for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS],
+            "body": digest,
+            "stored_at": time.time(),
+            "expires_at": time.time() + lifetime,
+        }
+        self._write(self._index_path(url), json.dumps(entry).encode("utf-8"))
+
+    def refresh(self, url, entry, not_modified):
+        """
+        Applies the headers of a 304 to a stored entry and restarts its clock.
+        """
+        headers = httpx.Headers(entry["headers"])
+        for name, value in not_modified.headers.items():
+            if name.lower() not in _WIRE_HEADERS:
+                headers[name] = value
+        lifetime = freshness_lifetime(headers, self.default_max_age)
+        entry["headers"] = list(headers.items())
+        entry["stored_at"] = time.time()
+        entry["expires_at"] = time.time() + (lifetime or 0)
+        self._write(self._index_path(url), json.dumps(entry).encode("utf-8"))
+
+    def _response(self, entry, body):
+        return httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            content=body,
+            request=httpx.Request("GET", entry["url"]),
+        )
+
+    async def get(self, http, url, **kwargs):
+        """
+        Same as `http.get(url)`, answered from disk when possible.
+        """
+        entry, body = self.load(url)
+        if entry is not None and entry["expires_at"] > time.time():
+            self.stats["fresh"] += 1
+            return self._response(entry, body)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            stored = httpx.Headers(entry["headers"])
+            if "etag" in stored:
+                headers["If-None-Match"] = stored["etag"]
+            if "last-modified" in stored:
+                headers["If-Modified-Since"] = stored["last-modified"]
+        try:
+            resp = await http.get(url, headers=headers, **kwargs)
+        except httpx.TransportError:
+            if entry is None:
+                raise
+            # Better a slightly old page than no page
+            self.stats["stale_on_error"] += 1
+            return self._response(entry, body)
+
+        if resp.status_code == 304 and entry is not None:
+            self.stats["revalidated"] += 1
+            self.refresh(url, entry, resp)
+            return self._response(entry, body)
+        self.stats["miss"] += 1
+        if resp.status_code == 200:
+            self.store(url, resp)
+        return resp
@@ -0,0 +1,78 @@
+"""
+Connection pool for the crawler: one httpx.AsyncClient with keep-alive,
+optional HTTP/2 and a cap on connections per host.
+"""
+import asyncio
+import importlib.util
+
+import httpx
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    # Hands the host slot back once the body has been read and closed
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Caps how many connections the pool opens to any one host, which httpx.Limits
+    only does for the pool as a whole.
+    """
+
+    def __init__(self, transport, max_per_host):
+        self.transport = transport
+        self.max_per_host = max_per_host
+        self._slots = {}
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.max_per_host)
+        slot = self._slots[host]
+        await slot.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        if response.is_closed:
+            # Body already read (e.g. a mock transport), nothing left to wait for
+            slot.release()
+        else:
+            response.stream = _ReleasingStream(response.stream, slot.release)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def make_http_client(pool):
+    """
+    Builds the pooled client shared by the whole crawl.
+    """
+    limits = httpx.Limits(
+        max_connections=pool["max_connections"],
+        max_keepalive_connections=pool["max_keepalive_connections"],
+        keepalive_expiry=pool["keepalive_expiry"],
+    )
+    http2 = pool["http2"] and importlib.util.find_spec("h2") is not None
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    return httpx.AsyncClient(
+        transport=HostLimitedTransport(transport, pool["max_per_host"]),
+        follow_redirects=True,
+        # No pool-wide timeout: page fetches and searches pass their own, and the
+        # OpenAI client shares this pool with a much longer one
+        timeout=None,
+    )
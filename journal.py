@@ -0,0 +1,84 @@
+"""
+Work journal for resuming an interrupted crawl.
+
+Each finished unit of work is recorded in SQLite as it completes: search result
+pages (with their results), URLs whose records have been written, and model
+replies. A restarted run with the same journal replays search pages, skips
+finished URLs and reuses replies, so it picks up where the last run stopped
+without spending Serper or OpenAI quota again.
+"""
+import json
+import os
+import sqlite3
+import time
+
+
+class Journal:
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        # WAL + NORMAL: every commit survives a killed process, and is cheap
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS searches ("
+            " query TEXT NOT NULL, page INTEGER NOT NULL, results TEXT NOT NULL, finished REAL NOT NULL,"
+            " PRIMARY KEY (query, page));"
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " url TEXT PRIMARY KEY, outcome TEXT, finished REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS llm_calls ("
+            " key TEXT PRIMARY KEY, reply TEXT NOT NULL, finished REAL NOT NULL);"
+        )
+        self.conn.commit()
+        self.stats = {"searches_replayed": 0, "urls_skipped": 0, "llm_replayed": 0}
+
+    def search_page(self, query, page):
+        """
+        Returns the journaled results for a search page, or None.
+        """
+        row = self.conn.execute(
+            "SELECT results FROM searches WHERE query = ? AND page = ?", (query, page)
+        ).fetchone()
+        if row is None:
+            return None
+        self.stats["searches_replayed"] += 1
+        return json.loads(row[0])
+
+    def finish_search_page(self, query, page, results):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO searches (query, page, results, finished) VALUES (?, ?, ?, ?)",
+            (query, page, json.dumps(results), time.time()),
+        )
+        self.conn.commit()
+
+    def url_done(self, url):
+        done = self.conn.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
+        if done:
+            self.stats["urls_skipped"] += 1
+        return done
+
+    def finish_url(self, url, outcome=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO urls (url, outcome, finished) VALUES (?, ?, ?)",
+            (url, outcome, time.time()),
+        )
+        self.conn.commit()
+
+    def llm_reply(self, key):
+        row = self.conn.execute("SELECT reply FROM llm_calls WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.stats["llm_replayed"] += 1
+        return row[0]
+
+    def finish_llm_call(self, key, reply):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO llm_calls (key, reply, finished) VALUES (?, ?, ?)",
+            (key, reply, time.time()),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
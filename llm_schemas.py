@@ -0,0 +1,104 @@
+"""
+Pydantic models for the model's JSON replies, and the strict JSON-schema
+response formats built from them.
+
+With a schema-constrained response format the reply is a single valid object,
+so nested values such as an "Opening Hours" dict can no longer truncate it.
+If a reply still doesn't validate, e.g. when it was cut off at max_tokens,
+read_json() recovers whatever complete fields it holds with jiter's partial
+parser, so the call isn't wasted.
+"""
+import functools
+from typing import Annotated, Literal, Optional
+
+import jiter
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, create_model
+
+from structured_data import RECORD_FIELDS
+
+
+def _as_text(value):
+    # Models sometimes answer "Opening Hours" as {"Monday": "10-12", ...} or a list
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {v}" for k, v in value.items() if v) or None
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value if v) or None
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+Text = Annotated[Optional[str], BeforeValidator(_as_text)]
+
+
+def _attr(field):
+    return field.lower().replace(" ", "_")
+
+@functools.lru_cache(maxsize=None)
+def record_model(fields=tuple(RECORD_FIELDS)):
+    """
+    A record model with just `fields`, keyed by their output names
+    ("Opening Hours", ...). gpt_parse_foodbank asks for subsets of the fields.
+    """
+    return create_model(
+        "FoodbankRecord",
+        __config__=ConfigDict(populate_by_name=True, extra="ignore"),
+        **{_attr(f): (Text, Field(None, alias=f)) for f in fields},
+    )
+
+FoodbankRecord = record_model()
+
+
+class FoodbankPage(BaseModel):
+    page_type: Literal["single", "directory", "other"]
+    foodbank: Optional[FoodbankRecord]
+
+
+def _strict(schema):
+    # OpenAI's strict mode wants every property required and no extras
+    if isinstance(schema, dict):
+        schema.pop("default", None)
+        schema.pop("title", None)
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["required"] = list(schema["properties"])
+            schema["additionalProperties"] = False
+        for value in schema.values():
+            _strict(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            _strict(value)
+    return schema
+
+@functools.lru_cache(maxsize=None)
+def _schema(model):
+    return _strict(model.model_json_schema(by_alias=True))
+
+def response_format(model, name):
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": _schema(model)},
+    }
+
+def read_json(text):
+    """
+    Parses the first JSON object in `text`, tolerating text around it and a
+    reply cut off part way through. Raises ValueError if there is none.
+    """
+    start = (text or "").find("{")
+    if start < 0:
+        raise ValueError("No JSON found")
+    # "on" drops a value cut off mid-string rather than keeping its first half
+    data = jiter.from_json(text[start:].encode("utf-8"), partial_mode="on")
+    if not isinstance(data, dict):
+        raise ValueError("No JSON object found")
+    return data
+
+def parse_reply(model, content):
+    """
+    Validates a reply against `model` and returns it as a dict with the output
+    field names. Falls back to read_json() for replies that aren't clean JSON.
+    """
+    try:
+        parsed = model.model_validate_json(content or "")
+    except ValidationError:
+        parsed = model.model_validate(read_json(content))
+    return parsed.model_dump(by_alias=True)
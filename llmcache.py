@@ -0,0 +1,90 @@
+"""
+Persistent cache for chat completion replies.
+
+Our prompts are deterministic (temperature 0 / 0.1), so the same page text sent
+with the same template and parameters gets the same answer. Replies are keyed
+on a hash of (model, template name, template version, prompt, params) and kept
+in SQLite. Once the cache grows past `max_bytes`, the least recently used
+replies are evicted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+LLM_CACHE_PATH = os.path.join(".cache", "llm.sqlite")
+LLM_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+
+def make_key(model, template, version, prompt, params):
+    payload = json.dumps(
+        {"model": model, "template": template, "version": version, "prompt": prompt, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS replies ("
+            " key TEXT PRIMARY KEY,"
+            " template TEXT,"
+            " reply TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS replies_last_used ON replies (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        row = self.conn.execute("SELECT reply FROM replies WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.conn.execute("UPDATE replies SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return row[0]
+
+    def put(self, key, template, reply):
+        size = len(reply.encode("utf-8"))
+        now = time.time()
+        old = self.conn.execute("SELECT size FROM replies WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO replies (key, template, reply, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, template, reply, size, now, now),
+        )
+        self.total_bytes += size - (old[0] if old else 0)
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM replies ORDER BY last_used"):
+            if self.total_bytes <= self.max_bytes:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM replies WHERE key = ?", doomed)
+        self.stats["evictions"] += len(doomed)
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups if lookups else 0.0
+        return f"{self.stats} hit rate {rate:.0%}, {self.total_bytes / 1024:.0f} KiB stored"
+
+    def close(self):
+        self.conn.close()
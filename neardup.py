@@ -0,0 +1,91 @@
+"""
+Near-duplicate page detection with SimHash.
+
+Food bank networks run templated sites, and the same text turns up under
+several URLs and mirrors. Each page's cleaned main text gets a 64-bit SimHash
+over word 3-shingles; pages whose fingerprints differ in at most
+NEAR_DUP_DISTANCE bits are near-duplicates. The index splits each fingerprint
+into NEAR_DUP_DISTANCE + 1 bands, so by pigeonhole any match shares at least
+one band exactly and a lookup only compares against a handful of candidates.
+"""
+import hashlib
+import re
+from collections import Counter
+
+NEAR_DUP_DISTANCE = 3  # of 64 bits
+NEAR_DUP_MIN_WORDS = 40  # shorter texts fingerprint too coarsely to compare
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _digest(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+
+def simhash(text, min_words=NEAR_DUP_MIN_WORDS):
+    """
+    The 64-bit SimHash of `text`, or None when it has fewer than `min_words` words.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < max(min_words, 3):
+        return None
+    shingles = {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+    digests = [_digest(s) for s in shingles]
+    # A bit is set when more than half the shingles' hashes have it set.
+    # Counting byte values column by column keeps the per-shingle work small.
+    fingerprint = 0
+    for column in range(8):
+        ones = [0] * 8
+        for value, n in Counter(d[column] for d in digests).items():
+            for bit in range(8):
+                if value >> bit & 1:
+                    ones[bit] += n
+        for bit in range(8):
+            if 2 * ones[bit] > len(digests):
+                fingerprint |= 1 << (column * 8 + bit)
+    return fingerprint
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Maps fingerprints to values and finds the value of the closest fingerprint
+    within `max_distance` bits.
+    """
+
+    def __init__(self, max_distance=NEAR_DUP_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.width = 64 // self.bands
+        self.buckets = {}  # (band, bits) -> [fingerprint, ...]
+        self.values = {}  # fingerprint -> value
+
+    def _keys(self, fingerprint):
+        mask = (1 << self.width) - 1
+        for band in range(self.bands):
+            yield band, (fingerprint >> (band * self.width)) & mask
+
+    def add(self, fingerprint, value):
+        if fingerprint not in self.values:
+            for key in self._keys(fingerprint):
+                self.buckets.setdefault(key, []).append(fingerprint)
+        self.values[fingerprint] = value
+
+    def find(self, fingerprint):
+        """
+        Returns (distance, value) of the nearest indexed fingerprint within
+        max_distance, or None.
+        """
+        if fingerprint in self.values:
+            return 0, self.values[fingerprint]
+        best = None
+        for key in self._keys(fingerprint):
+            for candidate in self.buckets.get(key, ()):
+                distance = hamming(fingerprint, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+        return (best[0], self.values[best[1]]) if best else None
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,140 @@
+"""
+Cheap local page classifier that runs before classify_page.
+
+Most pages are obvious: a food bank's own "get help" page with one postcode, a
+council list linking to a dozen food bank sites, or a page that never mentions
+food at all. preclassify() scores a handful of features (URL patterns, links
+to other food bank sites, postcodes, food keywords) and answers those cases
+without a model call. Anything in between returns None and goes to the model.
+
+The thresholds are tuned against the model's own answers. The crawler logs
+(features, model label) for every page it sends to the model, and
+`python bench.py tune-classifier` searches for the thresholds that decide the
+most pages locally while staying within a target precision. Pages decided
+locally only reach the model as a random audit sample, so each of those is
+logged with a weight of 1 / audit rate and counts for the pages it stands for.
+"""
+import itertools
+import json
+import re
+from urllib.parse import urljoin, urlsplit
+
+from structured_data import find_postcodes
+
+FOOD_TERMS_RE = re.compile(r"food[\s-]?banks?|food[\s-]?pantr(?:y|ies)|food parcels?|emergency food|community pantr", re.I)
+SINGLE_URL_RE = re.compile(r"get-help|find-a-foodbank|/contact|/about|/visit|opening-times|/donate", re.I)
+DIRECTORY_URL_RE = re.compile(r"director|/list|food-?banks-(?:in|near)|near-me|/locations|/services|/support", re.I)
+
+# A hand-set starting point; replace with the output of `python bench.py
+# tune-classifier` once crawls have logged enough labelled pages
+THRESHOLDS = {
+    # "other": at most this many food mentions, on a host that isn't a food bank's
+    "other_max_mentions": 0,
+    # "directory": links to at least this many other food bank sites, or this many postcodes
+    "directory_min_sites": 5,
+    "directory_min_postcodes": 4,
+    # "single": at most this many food bank sites linked and postcodes shown
+    "single_max_sites": 1,
+    "single_max_postcodes": 1,
+}
+
+_GRID = {
+    "other_max_mentions": [0, 1, 2],
+    "directory_min_sites": [3, 4, 5, 6, 8, 10],
+    "directory_min_postcodes": [3, 4, 6, 8, 1000],
+    "single_max_sites": [0, 1, 2],
+    "single_max_postcodes": [0, 1, 2],
+}
+
+
+def _host(url):
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+def page_features(page):
+    """
+    The numbers preclassify() decides on, as a small JSON-friendly dict.
+    """
+    host = _host(page.url)
+    food_sites = set()
+    links = 0
+    for a in page.soup.find_all("a", href=True):
+        links += 1
+        href = urljoin(page.url, a["href"])
+        link_host = _host(href)
+        if not link_host or link_host == host:
+            continue
+        if FOOD_TERMS_RE.search(href) or FOOD_TERMS_RE.search(a.get_text(" ", strip=True)):
+            food_sites.add(link_host)
+    return {
+        "mentions": len(FOOD_TERMS_RE.findall(page.text)),
+        "food_host": bool(FOOD_TERMS_RE.search(host.replace(".", " "))),
+        "single_url": bool(SINGLE_URL_RE.search(page.url)),
+        "directory_url": bool(DIRECTORY_URL_RE.search(page.url)),
+        "food_sites": len(food_sites),
+        "postcodes": len(find_postcodes(page.text)),
+        "links": links,
+    }
+
+def preclassify(features, thresholds=THRESHOLDS):
+    """
+    Returns "single", "directory" or "other" when the features make the answer
+    obvious, or None when the model should decide.
+    """
+    t = thresholds
+    if features["mentions"] <= t["other_max_mentions"] and not features["food_host"]:
+        return "other"
+    if features["food_sites"] >= t["directory_min_sites"] or features["postcodes"] >= t["directory_min_postcodes"]:
+        return "directory"
+    if ((features["single_url"] or features["food_host"]) and not features["directory_url"]
+            and features["food_sites"] <= t["single_max_sites"]
+            and features["postcodes"] <= t["single_max_postcodes"]):
+        return "single"
+    return None
+
+def load_labels(path):
+    """
+    (features, label, weight) for each page in the label log.
+    """
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                samples.append((row["features"], row["label"], float(row.get("weight", 1))))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return samples
+
+def evaluate(samples, thresholds=THRESHOLDS):
+    """
+    Returns (coverage, precision): the share of pages decided locally, and
+    how many of those decisions agree with the model, each page counted by
+    its weight.
+    """
+    total = decided = agreed = 0
+    for features, label, weight in samples:
+        total += weight
+        guess = preclassify(features, thresholds)
+        if guess is not None:
+            decided += weight
+            agreed += weight * (guess == label)
+    coverage = decided / total if total else 0.0
+    precision = agreed / decided if decided else 1.0
+    return coverage, precision
+
+def tune(samples, min_precision=0.97):
+    """
+    Grid-searches THRESHOLDS for the highest coverage whose precision is at
+    least `min_precision`. Returns (thresholds, coverage, precision).
+    """
+    best = (dict(THRESHOLDS), *evaluate(samples, THRESHOLDS))
+    if best[2] < min_precision:
+        best = (best[0], 0.0, best[2])
+    names = list(_GRID)
+    for values in itertools.product(*(_GRID[n] for n in names)):
+        thresholds = dict(zip(names, values))
+        coverage, precision = evaluate(samples, thresholds)
+        if precision >= min_precision and coverage > best[1]:
+            best = (thresholds, coverage, precision)
+    return best
@@ -0,0 +1,305 @@
+"""
+Entity resolution: which records describe the same food bank.
+
+One food bank turns up many times in a crawl: its own site, its Facebook page,
+a council directory entry, under a different search term. resolve() merges
+those records into one each. Every record gets a handful of exact blocking
+keys, all normalised:
+
+- its site: the registered domain of the page and of its Website field, or the
+  tenant's subdomain / profile on shared hosts such as facebook.com or
+  foodbank.org.uk, which host many different food banks;
+- its phone numbers in E.164 and its email addresses;
+- its postcode with the house number (or first address line), so "1 High St,
+  M1 1AA" and "1 High Street, Manchester M1 1AA" meet;
+- its postcode with its name, minus words like "food bank".
+
+Records sharing a key are unioned, so the work is one pass over the keys plus
+near-constant union-find operations, whatever the number of records. A key
+shared by too many records, or a phone, email or site seen alongside different
+postcodes, is a helpline or a directory rather than an identifier and joins
+nothing. Each merged food bank then takes every field from the record most
+likely to have it right: the most common name, postcode, phone and email, the
+fullest address and opening hours, and its own website over a profile page.
+"""
+import re
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+from structured_data import RECORD_FIELDS, UK_POSTCODE_RE, normalise_postcode
+
+MAX_BLOCK_SIZE = 25  # records one key may join
+
+# Registered domains whose pages belong to many different organisations
+SHARED_DOMAINS = {
+    "facebook.com", "fb.com", "instagram.com", "twitter.com", "x.com", "linkedin.com", "youtube.com",
+    "tiktok.com", "linktr.ee", "google.com", "wixsite.com", "wordpress.com", "blogspot.com",
+    "squarespace.com", "weebly.com", "jimdosite.com", "webs.com", "justgiving.com", "eventbrite.co.uk",
+    "foodbank.org.uk", "trusselltrust.org", "charitycommission.gov.uk", "yell.com", "192.com",
+}
+# Shared hosts where the first path segment names the organisation
+PROFILE_DOMAINS = {"facebook.com", "fb.com", "instagram.com", "twitter.com", "x.com", "tiktok.com", "linktr.ee"}
+# Public-sector sites list many food banks; none of them is one
+SHARED_SUFFIXES = (".gov.uk", ".nhs.uk", ".ac.uk", ".sch.uk", ".police.uk")
+
+# National freephone helplines (e.g. Trussell's) appear on many food banks' pages
+NATIONAL_PHONE_PREFIXES = ("+44800", "+44808")
+
+_NAME_STOPWORDS = {
+    "the", "and", "of", "food", "foods", "bank", "banks", "foodbank", "foodbanks", "pantry", "larder",
+    "project", "trust", "charity", "cic", "ltd", "limited", "inc", "uk", "home", "welcome", "contact", "us",
+}
+_ABBREVIATIONS = {
+    "st": "street", "rd": "road", "ave": "avenue", "av": "avenue", "ln": "lane", "dr": "drive", "ct": "court",
+    "pl": "place", "sq": "square", "cres": "crescent", "cl": "close", "gdns": "gardens", "ter": "terrace",
+    "terr": "terrace", "pk": "park", "hse": "house", "bldg": "building",
+}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_HOUSE_NUMBER_RE = re.compile(r"\b(\d+[a-z]?)\b")
+_PHONE_SPLIT_RE = re.compile(r"\s*(?:/|,|;|\bor\b|\band\b)\s*", re.I)
+_EXTENSION_RE = re.compile(r"\bext", re.I)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+
+def phone_e164(phone):
+    """
+    A UK phone number in E.164 ("+441611234567"), or None if `phone` isn't one.
+    """
+    phone = (phone or "").strip()
+    digits = re.sub(r"\D", "", _EXTENSION_RE.split(phone)[0])
+    if phone.startswith("+") or digits.startswith("44"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = "44" + digits[1:]
+    else:
+        return None
+    if digits.startswith("440"):  # "+44 (0)161 ..."
+        digits = "44" + digits[3:]
+    if not digits.startswith("44") or len(digits) not in (11, 12):
+        return None
+    return "+" + digits
+
+def phone_numbers(value):
+    numbers = []
+    for part in _PHONE_SPLIT_RE.split(value or ""):
+        number = phone_e164(part)
+        if number and number not in numbers:
+            numbers.append(number)
+    return numbers
+
+def emails(value):
+    return sorted({e.lower().rstrip(".") for e in _EMAIL_RE.findall(value or "")})
+
+def site_key(url, domain_of):
+    """
+    What identifies the organisation behind `url`: its registered domain, or on
+    shared hosts its subdomain or profile path. None when the URL can't tell
+    organisations apart (e.g. a council page).
+    """
+    if not url:
+        return None
+    if "//" not in url:
+        url = "https://" + url
+    domain = domain_of(url)
+    if not domain or domain.startswith(".") or domain.endswith("."):
+        return None
+    if domain.endswith(SHARED_SUFFIXES):
+        return None
+    if domain not in SHARED_DOMAINS:
+        return domain
+    parts = urlsplit(url)
+    if domain not in PROFILE_DOMAINS:
+        host = (parts.hostname or "").removeprefix("www.")
+        return host if host != domain else None  # southmanchester.foodbank.org.uk
+    # m.facebook.com/page is the same profile as facebook.com/page
+    segments = [s for s in parts.path.lower().split("/") if s]
+    if segments[:1] == ["profile.php"]:
+        profile = parse_qs(parts.query).get("id")
+        return f"{domain}/profile/{profile[0]}" if profile else None
+    if segments[:1] in (["groups"], ["pages"], ["people"]) and len(segments) > 1:
+        segments = segments[:2]
+    else:
+        segments = segments[:1]
+    return f"{domain}/{'/'.join(segments)}" if segments else None
+
+def name_key(name):
+    words = [w for w in _WORD_RE.findall((name or "").lower()) if w not in _NAME_STOPWORDS]
+    return " ".join(sorted(set(words))) or None
+
+def address_key(address):
+    """
+    The house number in `address`, or else its first line, normalised.
+    """
+    address = UK_POSTCODE_RE.sub(" ", (address or "").upper()).lower()
+    number = _HOUSE_NUMBER_RE.search(address)
+    if number:
+        return number.group(1)
+    first_line = address.split(",")[0]
+    words = [_ABBREVIATIONS.get(w, w) for w in _WORD_RE.findall(first_line.replace("'", ""))]
+    return " ".join(words) or None
+
+def _text(value):
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value or None
+    return None
+
+def fields(record):
+    """
+    The food bank fields of a record, or None for error and non-food bank records.
+    """
+    structured = record.get("structured")
+    if not isinstance(structured, dict) or structured.get("error"):
+        return None
+    values = {field: _text(structured.get(field)) for field in RECORD_FIELDS}
+    return values if any(values.values()) else None
+
+def record_postcode(values):
+    return normalise_postcode(values["Postcode"]) or normalise_postcode(values["Address"])
+
+def blocking_keys(record, values, postcode, domain_of):
+    """
+    (kind, value) pairs; records sharing any of them are the same food bank.
+    """
+    keys = set()
+    for url in (record.get("url"), values["Website"]):
+        site = site_key(url, domain_of)
+        if site:
+            keys.add(("site", site))
+    for number in phone_numbers(values["Phone"]):
+        if not number.startswith(NATIONAL_PHONE_PREFIXES):
+            keys.add(("phone", number))
+    for email in emails(values["Email"]):
+        keys.add(("email", email))
+    if postcode:
+        address = address_key(values["Address"])
+        if address:
+            keys.add(("address", postcode, address))
+        name = name_key(values["Name"])
+        if name:
+            keys.add(("name", postcode, name))
+    return keys
+
+
+class UnionFind:
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]  # path halving
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+def _vote(values, normalise=None, prefer=None):
+    """
+    The value whose normalised form is most common, ties going to `prefer`
+    and then the longest.
+    """
+    groups = defaultdict(list)
+    for value in values:
+        if value:
+            key = normalise(value) if normalise else value.lower()
+            groups[key or value.lower()].append(value)
+    if not groups:
+        return None
+    best = max(groups.values(), key=lambda g: (len(g), bool(prefer and prefer(g[0])), max(map(len, g))))
+    return max(best, key=len)
+
+def _longest(values):
+    values = [v for v in values if v]
+    return max(values, key=len) if values else None
+
+def _survive(members, domain_of):
+    """
+    Field-level survivorship over the (record, fields, postcode) of each record
+    of one food bank.
+    """
+    merged = {}
+    values = {field: [m[1][field] for m in members] for field in RECORD_FIELDS}
+    postcode = _vote([m[2] for m in members])
+    merged["Name"] = _vote(values["Name"], normalise=name_key)
+    # The fullest address that agrees with the surviving postcode
+    addresses = [a for a in values["Address"] if a and normalise_postcode(a) in (None, postcode)]
+    merged["Address"] = _longest(addresses) or _longest(values["Address"])
+    merged["Postcode"] = postcode
+    merged["Phone"] = _vote(values["Phone"], normalise=lambda p: (phone_numbers(p) or [None])[0])
+    merged["Email"] = _vote(values["Email"], normalise=lambda e: (emails(e) or [None])[0])
+    merged["Opening Hours"] = _longest(values["Opening Hours"])
+    # The food bank's own site over a Facebook page or a directory listing
+    merged["Website"] = _vote(values["Website"],
+                              prefer=lambda url: (domain_of(url if "//" in url else "https://" + url)
+                                                  not in SHARED_DOMAINS))
+    merged["Any special requirements"] = _longest(values["Any special requirements"])
+    return merged
+
+def resolve(records, domain_of, max_block=MAX_BLOCK_SIZE):
+    """
+    Merges the food bank records in `records` (error and directory records are
+    left out) and returns one record per food bank, in order of first
+    appearance, with the URLs it was merged from in "sources".
+    `domain_of(url)` returns a URL's registered domain.
+    """
+    members = []
+    keys = []
+    for record in records:
+        values = fields(record)
+        if values is not None:
+            postcode = record_postcode(values)
+            members.append((record, values, postcode))
+            keys.append(blocking_keys(record, values, postcode, domain_of))
+
+    # A key joining too many records, or records at different postcodes,
+    # isn't identifying anyone
+    counts = Counter(key for record_keys in keys for key in record_keys)
+    postcodes = defaultdict(set)
+    for (_, _, postcode), record_keys in zip(members, keys):
+        if postcode:
+            for key in record_keys:
+                if key[0] in ("site", "phone", "email"):
+                    postcodes[key].add(postcode)
+    usable = {key for key, n in counts.items() if n <= max_block and len(postcodes.get(key, ())) <= 1}
+
+    clusters = UnionFind(len(members))
+    first = {}
+    for i, record_keys in enumerate(keys):
+        for key in record_keys & usable:
+            clusters.union(first.setdefault(key, i), i)
+
+    groups = defaultdict(list)
+    for i in range(len(members)):
+        groups[clusters.find(i)].append(members[i])
+
+    resolved = []
+    for group in groups.values():
+        # Record-level fields come from the record filling the most fields
+        primary = max(group, key=lambda m: sum(1 for v in m[1].values() if v))[0]
+        structured = _survive(group, domain_of)
+        sources = []
+        for record, _, _ in group:
+            if record.get("url") and record["url"] not in sources:
+                sources.append(record["url"])
+        resolved.append({
+            "name": structured["Name"] or primary.get("name"),
+            "url": primary.get("url"),
+            "domain": primary.get("domain"),
+            "location": primary.get("location"),
+            "structured": structured,
+            "sources": sources,
+        })
+    return resolved
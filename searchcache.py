@@ -0,0 +1,124 @@
+"""
+Search result cache and Serper quota ledger.
+
+Results for a query barely change from day to day, so each search results page
+is kept in SQLite, keyed on (query, page, gl, hl), and served again until it is
+older than the TTL. Re-runs and development iterations then cost no Serper
+credits and skip the round trip.
+
+The ledger records every page actually bought from Serper, with the run it
+belongs to, and enforces an optional per-run credit budget.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+SEARCH_CACHE_PATH = os.path.join(".cache", "search.sqlite")
+SEARCH_CACHE_TTL = 3 * 24 * 3600  # seconds
+
+# Serper charges one credit per request for up to 10 results
+CREDITS_PER_PAGE = 1
+
+
+def _connect(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SearchCache:
+
+    def __init__(self, path=SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL):
+        self.ttl = ttl
+        self.conn = _connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_pages ("
+            " query TEXT NOT NULL, page INTEGER NOT NULL, gl TEXT NOT NULL, hl TEXT NOT NULL,"
+            " results TEXT NOT NULL, stored REAL NOT NULL,"
+            " PRIMARY KEY (query, page, gl, hl))"
+        )
+        self.conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    def get(self, query, page, gl=None, hl=None):
+        """
+        Returns the cached results for a search page, or None when there are
+        none or they are older than the TTL.
+        """
+        row = self.conn.execute(
+            "SELECT results, stored FROM search_pages WHERE query = ? AND page = ? AND gl = ? AND hl = ?",
+            (query, page, gl or "", hl or ""),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        if time.time() - row[1] > self.ttl:
+            self.stats["expired"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, query, page, results, gl=None, hl=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO search_pages (query, page, gl, hl, results, stored) VALUES (?, ?, ?, ?, ?, ?)",
+            (query, page, gl or "", hl or "", json.dumps(results), time.time()),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class QuotaLedger:
+    """
+    Credits spent on Serper by one run. With a `budget`, reserve() refuses
+    any request that could take the run past it.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_PATH, budget=None, run_id=None):
+        self.budget = budget
+        self.run_id = run_id or uuid.uuid4().hex
+        self.spent = 0
+        self.reserved = 0  # credits for requests still in flight
+        self.conn = _connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_credits ("
+            " run_id TEXT NOT NULL, query TEXT NOT NULL, page INTEGER NOT NULL,"
+            " credits INTEGER NOT NULL, spent REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS search_credits_run ON search_credits (run_id)")
+        self.conn.commit()
+
+    def reserve(self, credits=CREDITS_PER_PAGE):
+        """
+        Returns False, reserving nothing, if `credits` more could exceed the budget.
+        """
+        if self.budget is not None and self.spent + self.reserved + credits > self.budget:
+            return False
+        self.reserved += credits
+        return True
+
+    def release(self, credits=CREDITS_PER_PAGE):
+        # The request failed before Serper charged for it
+        self.reserved -= credits
+
+    def record(self, query, page, credits=CREDITS_PER_PAGE):
+        self.reserved -= credits
+        self.spent += credits
+        self.conn.execute(
+            "INSERT INTO search_credits (run_id, query, page, credits, spent) VALUES (?, ?, ?, ?, ?)",
+            (self.run_id, query, page, credits, time.time()),
+        )
+        self.conn.commit()
+
+    def summary(self):
+        budget = f" of {self.budget}" if self.budget is not None else ""
+        return f"{self.spent}{budget} credits spent this run (run {self.run_id})"
+
+    def close(self):
+        self.conn.close()
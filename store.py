@@ -0,0 +1,162 @@
+"""
+SQLite result store.
+
+Every record the crawl writes is also upserted here, one row per page keyed on
+its canonical URL, with indexed columns for the lookups downstream tools need:
+registered domain, postcode district and run. A row is only rewritten when the
+record for its page has changed, so re-running a crawl touches just the pages
+that changed, and the run_id on each row is the run that last changed it.
+"All food banks in M14" is then an index lookup rather than a scan of the
+JSONL output:
+
+    with ResultStore("results.sqlite") as store:
+        for record in store.query(postcode="M14"):
+            ...
+
+Records are buffered and written BATCH_SIZE at a time, each batch in one
+transaction. The JSONL output stays the crash-safe log; the store may miss
+the last unflushed batch of a killed run, which the next run fills in.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from structured_data import normalise_postcode, postcode_district
+from urlnorm import canonical_url
+
+BATCH_SIZE = 500
+
+_COLUMNS = ["canonical_url", "url", "name", "domain", "postcode", "district", "location", "is_foodbank",
+            "run_id", "record", "updated"]
+
+_UPSERT = (
+    f"INSERT INTO records ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})"
+    " ON CONFLICT (canonical_url) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in _COLUMNS[1:])
+    + " WHERE records.record IS NOT excluded.record"
+)
+
+
+def _row(record, run_id):
+    structured = record.get("structured")
+    if not isinstance(structured, dict):
+        structured = {}
+    is_foodbank = not structured.get("error") and any(v for v in structured.values())
+    postcode = None
+    for value in (structured.get("Postcode"), structured.get("Address")):
+        if isinstance(value, str):
+            postcode = postcode or normalise_postcode(value)
+    return (
+        canonical_url(record["url"]),
+        record["url"],
+        structured.get("Name") if isinstance(structured.get("Name"), str) else record.get("name"),
+        record.get("domain"),
+        postcode,
+        postcode_district(postcode),
+        record.get("location"),
+        int(is_foodbank),
+        run_id,
+        json.dumps(record, ensure_ascii=False),
+        time.time(),
+    )
+
+
+class ResultStore:
+    """
+    Upserts crawl records into SQLite in batches and looks them up by URL,
+    domain, postcode or run.
+    """
+
+    def __init__(self, path, run_id=None, batch_size=BATCH_SIZE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.run_id = run_id or uuid.uuid4().hex
+        self.batch_size = batch_size
+        self.pending = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " canonical_url TEXT PRIMARY KEY, url TEXT NOT NULL, name TEXT, domain TEXT,"
+            " postcode TEXT, district TEXT, location TEXT, is_foodbank INTEGER NOT NULL,"
+            " run_id TEXT NOT NULL, record TEXT NOT NULL, updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS records_domain ON records (domain);"
+            "CREATE INDEX IF NOT EXISTS records_district ON records (district, postcode);"
+            "CREATE INDEX IF NOT EXISTS records_run ON records (run_id);"
+        )
+        self.conn.commit()
+        self.stats = {"changed": 0, "unchanged": 0}
+
+    def add(self, record):
+        if not record.get("url"):
+            return
+        self.pending.append(_row(record, self.run_id))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        before = self.conn.total_changes
+        with self.conn:  # one transaction per batch
+            self.conn.executemany(_UPSERT, pending)
+        changed = self.conn.total_changes - before
+        self.stats["changed"] += changed
+        self.stats["unchanged"] += len(pending) - changed
+
+    def query(self, postcode=None, domain=None, run_id=None, url=None, foodbanks_only=True, limit=None):
+        """
+        The stored records matching every given filter. `postcode` may be a full
+        postcode ("M14 5AB") or a district ("M14"). Error and directory records
+        are left out unless `foodbanks_only` is False.
+        """
+        self.flush()
+        where = []
+        params = []
+        if postcode:
+            full = normalise_postcode(postcode)
+            if full:
+                where.append("district = ? AND postcode = ?")
+                params += [postcode_district(full), full]
+            else:
+                where.append("district = ?")
+                params.append(postcode.strip().upper())
+        if domain:
+            where.append("domain = ?")
+            params.append(domain.lower())
+        if run_id:
+            where.append("run_id = ?")
+            params.append(run_id)
+        if url:
+            where.append("canonical_url = ?")
+            params.append(canonical_url(url))
+        if foodbanks_only:
+            where.append("is_foodbank = 1")
+        sql = "SELECT record FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY canonical_url"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+
+    def summary(self):
+        self.flush()
+        total = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        return (f"{self.stats['changed']} records added or changed, {self.stats['unchanged']} unchanged, "
+                f"{total} stored (run {self.run_id})")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,220 @@
+"""
+Deterministic extraction of food bank details from a parsed page.
+
+Many sites already publish what we ask the model for: schema.org JSON-LD or
+microdata (name, address, telephone, openingHoursSpecification), and tel: and
+mailto: links. Reading those is free and exact, so the model only needs to be
+asked for whatever is still missing. Weaker hints (a lone postcode in the
+text, og:site_name, the site's address) only fill what the model leaves empty.
+"""
+import json
+import re
+from urllib.parse import unquote, urlsplit
+
+# Full UK postcode, e.g. "M14 5AB", "SW1A 1AA", "EH1 1YZ"
+UK_POSTCODE_RE = re.compile(r"\b([A-Z]{1,2}[0-9][A-Z0-9]?)\s*([0-9][ABD-HJLNP-UW-Z]{2})\b")
+
+# Fields a food bank record is made of, in output order
+RECORD_FIELDS = ["Name", "Address", "Postcode", "Phone", "Email", "Opening Hours", "Website", "Any special requirements"]
+
+# Fields this module can fill; the requirements blurb only ever comes from the model
+STRUCTURED_FIELDS = RECORD_FIELDS[:-1]
+
+_SCHEMA_KEYS = {
+    "name": "Name",
+    "telephone": "Phone",
+    "email": "Email",
+    "url": "Website",
+}
+
+
+def normalise_postcode(text):
+    match = UK_POSTCODE_RE.search((text or "").upper())
+    return f"{match.group(1)} {match.group(2)}" if match else None
+
+def postcode_district(postcode):
+    # "M14 5AB" -> "M14"
+    postcode = normalise_postcode(postcode)
+    return postcode.split()[0] if postcode else None
+
+def find_postcodes(text):
+    return {f"{a} {b}" for a, b in UK_POSTCODE_RE.findall(text or "")}
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+def _clean(value):
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value or None
+    return value
+
+def _format_address(address):
+    address = _first(address)
+    if isinstance(address, str):
+        return _clean(address), normalise_postcode(address)
+    if not isinstance(address, dict):
+        return None, None
+    parts = [address.get(k) for k in ("streetAddress", "addressLocality", "addressRegion", "postalCode")]
+    parts = [_clean(_first(p)) for p in parts if isinstance(_first(p), str) and _first(p).strip()]
+    postcode = normalise_postcode(_first(address.get("postalCode")))
+    return (", ".join(parts) or None), postcode
+
+def _day_name(day):
+    # "https://schema.org/Monday" -> "Monday"
+    return str(day).rstrip("/").rsplit("/", 1)[-1]
+
+def _format_hours(node):
+    specs = node.get("openingHoursSpecification")
+    if specs:
+        if isinstance(specs, dict):
+            specs = [specs]
+        slots = []
+        for spec in specs:
+            if not isinstance(spec, dict):
+                continue
+            days = spec.get("dayOfWeek") or []
+            if not isinstance(days, list):
+                days = [days]
+            hours = f"{spec.get('opens', '')}-{spec.get('closes', '')}".strip("-")
+            for day in days:
+                slots.append(f"{_day_name(day)}: {hours}")
+        if slots:
+            return ", ".join(slots)
+    hours = node.get("openingHours")
+    if isinstance(hours, list):
+        return ", ".join(str(h) for h in hours) or None
+    return _clean(hours)
+
+def _schema_nodes(data):
+    # Walks a JSON-LD document, including @graph lists and nested objects
+    if isinstance(data, list):
+        for item in data:
+            yield from _schema_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        for key, value in data.items():
+            if key != "address" and isinstance(value, (dict, list)):
+                yield from _schema_nodes(value)
+
+def _from_schema_node(node):
+    # Only nodes that describe a place or organisation, not e.g. a WebPage
+    if not any(k in node for k in ("address", "telephone", "openingHours", "openingHoursSpecification", "email")):
+        return {}
+    found = {}
+    for key, field in _SCHEMA_KEYS.items():
+        value = _clean(_first(node.get(key)))
+        if isinstance(value, str):
+            found[field] = value
+    address, postcode = _format_address(node.get("address"))
+    if address:
+        found["Address"] = address
+    if postcode:
+        found["Postcode"] = postcode
+    hours = _format_hours(node)
+    if hours:
+        found["Opening Hours"] = hours
+    if "Email" in found:
+        found["Email"] = found["Email"].removeprefix("mailto:")
+    return found
+
+def from_json_ld(soup):
+    found = {}
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            data = json.loads(script.string or script.get_text() or "")
+        except ValueError:
+            continue
+        for node in _schema_nodes(data):
+            for field, value in _from_schema_node(node).items():
+                found.setdefault(field, value)
+    return found
+
+def _microdata_value(el):
+    if el.has_attr("content"):
+        return el["content"]
+    if el.name in ("a", "link") and el.has_attr("href"):
+        return el["href"]
+    return el.get_text(" ", strip=True)
+
+def _microdata_props(scope):
+    # Properties of this item only, not of items nested inside it
+    props = {}
+    for el in scope.find_all(attrs={"itemprop": True}):
+        owner = el.find_parent(attrs={"itemscope": True})
+        if owner is not scope:
+            continue
+        name = el["itemprop"]
+        if el.has_attr("itemscope"):
+            props.setdefault(name, _microdata_props(el))
+        else:
+            props.setdefault(name, _clean(_microdata_value(el)))
+    return props
+
+def from_microdata(soup):
+    found = {}
+    for scope in soup.find_all(attrs={"itemscope": True, "itemtype": True}):
+        if scope.has_attr("itemprop"):
+            continue  # nested item, handled through its parent
+        for field, value in _from_schema_node(_microdata_props(scope)).items():
+            found.setdefault(field, value)
+    return found
+
+def from_links(soup):
+    found = {}
+    for a in soup.find_all("a", href=True):
+        href = a["href"].strip()
+        scheme = href[:7].lower()
+        if "Phone" not in found and scheme.startswith("tel:"):
+            found["Phone"] = _clean(unquote(href[4:])) or None
+        elif "Email" not in found and scheme == "mailto:":
+            email = unquote(href[7:]).split("?", 1)[0].strip()
+            if "@" in email:
+                found["Email"] = email
+    return {k: v for k, v in found.items() if v}
+
+def extract_structured_data(soup):
+    """
+    Returns the record fields the page states outright, most trustworthy
+    source first: JSON-LD, microdata, then tel:/mailto: links. These win over
+    the model's reading of the page.
+    """
+    found = {}
+    for source in (from_json_ld, from_microdata, from_links):
+        for field, value in source(soup).items():
+            found.setdefault(field, value)
+    return found
+
+def _shared_host(host):
+    # A page on facebook.com or a council site isn't the food bank's own site.
+    # Tenants' subdomains (e.g. on foodbank.org.uk) are.
+    from resolve import SHARED_DOMAINS, SHARED_SUFFIXES
+
+    host = host.lower().removeprefix("www.")
+    return host in SHARED_DOMAINS or host.endswith(SHARED_SUFFIXES)
+
+def fallback_fields(soup, url=None):
+    """
+    Guesses for fields neither the structured data nor the model filled: a
+    single postcode in the page text, og:site_name and the site's own address.
+    The last two are skipped on shared hosts, where they'd give "Facebook".
+    """
+    found = {}
+    # Only when unambiguous; several postcodes usually means several places
+    postcodes = find_postcodes(soup.get_text(" "))
+    if len(postcodes) == 1:
+        found["Postcode"] = postcodes.pop()
+
+    parts = urlsplit(url or "")
+    if parts.hostname and _shared_host(parts.hostname):
+        return found
+
+    site_name = soup.find("meta", attrs={"property": "og:site_name"})
+    if site_name and _clean(site_name.get("content")):
+        found["Name"] = _clean(site_name["content"])
+
+    if parts.scheme and parts.netloc:
+        found["Website"] = f"{parts.scheme}://{parts.netloc}"
+    return found
@@ -0,0 +1,72 @@
+import asyncio
+
+from batch import BatchQueue, BatchRequestError, LocalBatchRunner, read_batch_file
+
+
+def body(prompt):
+    return {"model": "m", "messages": [{"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 5}
+
+def respond(body):
+    prompt = body["messages"][0]["content"]
+    if prompt == "bad":
+        raise ValueError("model refused")
+    return prompt.upper()
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_replies_reach_their_callers(tmp_path):
+    async def main():
+        queue = BatchQueue(LocalBatchRunner(respond), str(tmp_path), linger=0.01)
+        replies = await asyncio.gather(*(queue.submit(f"id-{p}", body(p)) for p in ["a", "b", "c"]))
+        await queue.close()
+        return replies, queue.stats
+
+    replies, stats = run(main())
+    assert replies == ["A", "B", "C"]
+    assert stats == {"batches": 1, "requests": 3, "errors": 0}
+
+def test_a_failed_line_only_fails_its_own_request(tmp_path):
+    async def main():
+        queue = BatchQueue(LocalBatchRunner(respond), str(tmp_path), linger=0.01)
+        results = await asyncio.gather(queue.submit("good", body("ok")), queue.submit("bad", body("bad")),
+                                       return_exceptions=True)
+        await queue.close()
+        return results, queue.stats
+
+    (good, bad), stats = run(main())
+    assert good == "OK"
+    assert isinstance(bad, BatchRequestError) and "model refused" in str(bad)
+    assert stats["errors"] == 1
+
+def test_lines_missing_from_the_output_fail(tmp_path):
+    class Partial(LocalBatchRunner):
+        # Like an expired batch: only some lines come back
+        async def run(self, input_path, output_path):
+            results = await super().run(input_path, output_path)
+            return [r for r in results if r["custom_id"] != "lost"]
+
+    async def main():
+        queue = BatchQueue(Partial(respond), str(tmp_path), linger=0.01)
+        results = await asyncio.gather(queue.submit("kept", body("x")), queue.submit("lost", body("y")),
+                                       return_exceptions=True)
+        await queue.close()
+        return results
+
+    kept, lost = run(main())
+    assert kept == "X"
+    assert isinstance(lost, BatchRequestError) and "no result" in str(lost)
+
+def test_full_batches_are_sent_without_waiting(tmp_path):
+    async def main():
+        queue = BatchQueue(LocalBatchRunner(respond), str(tmp_path), max_requests=2, linger=60)
+        replies = await asyncio.wait_for(
+            asyncio.gather(queue.submit("1", body("p")), queue.submit("2", body("q"))), timeout=5)
+        await queue.close()
+        return replies
+
+    assert run(main()) == ["P", "Q"]
+    inputs = sorted(tmp_path.glob("*-input.jsonl"))
+    assert len(inputs) == 1
+    assert [line["custom_id"] for line in read_batch_file(inputs[0])] == ["1", "2"]
@@ -0,0 +1,89 @@
+from resolve import phone_e164, phone_numbers, resolve, site_key
+
+
+def domain_of(url):
+    # Two-label registered domains, three under .uk, are enough here
+    host = url.split("/")[2].split(":")[0].lower().removeprefix("www.")
+    labels = host.split(".")
+    return ".".join(labels[-3:] if host.endswith(".uk") else labels[-2:])
+
+def record(url, **structured):
+    return {"name": url, "url": url, "domain": domain_of(url), "location": "Manchester UK", "structured": structured}
+
+
+def test_phone_e164():
+    assert phone_e164("0161 123 4567") == "+441611234567"
+    assert phone_e164("+44 (0)161 123 4567") == "+441611234567"
+    assert phone_e164("0044 161 123 4567") == "+441611234567"
+    assert phone_e164("44 161 123 4567") == "+441611234567"
+    assert phone_e164("07700 900123") == "+447700900123"
+    assert phone_e164("0161-123-4567 ext. 12") == "+441611234567"
+    assert phone_e164("+1 555 123 4567") is None
+    assert phone_e164("123") is None
+    assert phone_e164("") is None
+    assert phone_e164(None) is None
+
+def test_phone_numbers_splits_lists():
+    assert phone_numbers("0161 123 4567 / 07700 900123 or 0161 123 4567") == ["+441611234567", "+447700900123"]
+
+def test_address_variants_merge():
+    foodbanks = resolve([
+        record("https://northfoodbank.org.uk/", Name="North Foodbank", Address="1 High St, M1 1AA"),
+        record("https://manchesterdirectory.example.com/north", Name="North Food Bank",
+               Address="1 High Street, Manchester M1 1AA", Phone="0161 123 4567"),
+    ], domain_of)
+    assert len(foodbanks) == 1
+    merged = foodbanks[0]
+    assert merged["structured"]["Postcode"] == "M1 1AA"
+    assert merged["structured"]["Address"] == "1 High Street, Manchester M1 1AA"
+    assert merged["structured"]["Phone"] == "0161 123 4567"
+    assert merged["sources"] == ["https://northfoodbank.org.uk/", "https://manchesterdirectory.example.com/north"]
+
+def test_facebook_food_banks_stay_apart():
+    foodbanks = resolve([
+        record("https://www.facebook.com/NorthFoodbank/", Name="North Foodbank", Address="1 High St, M1 1AA"),
+        record("https://www.facebook.com/SouthFoodbank/", Name="South Foodbank", Address="9 Low Road, M14 5AB"),
+        record("https://www.facebook.com/profile.php?id=100012345", Name="East Pantry", Postcode="M4 6BB"),
+    ], domain_of)
+    assert sorted(f["structured"]["Name"] for f in foodbanks) == ["East Pantry", "North Foodbank", "South Foodbank"]
+
+def test_one_facebook_page_merges_with_its_own_site():
+    foodbanks = resolve([
+        record("https://www.facebook.com/NorthFoodbank/", Name="North Foodbank", Postcode="M1 1AA",
+               Website="https://northfoodbank.org.uk"),
+        record("https://m.facebook.com/northfoodbank/about", Name="North Foodbank", Phone="0161 123 4567"),
+        record("https://northfoodbank.org.uk/contact", Name="North Foodbank Manchester", Email="Help@NorthFoodbank.org.uk"),
+    ], domain_of)
+    assert len(foodbanks) == 1
+    merged = foodbanks[0]["structured"]
+    assert merged["Website"] == "https://northfoodbank.org.uk"
+    assert merged["Phone"] == "0161 123 4567"
+    assert merged["Email"] == "Help@NorthFoodbank.org.uk"
+
+def test_shared_helplines_and_directories_join_nothing():
+    foodbanks = resolve([
+        record("https://northfoodbank.org.uk/", Name="North Foodbank", Postcode="M1 1AA", Phone="0808 208 2138"),
+        record("https://southfoodbank.org.uk/", Name="South Foodbank", Postcode="M14 5AB", Phone="0808 208 2138"),
+        # One council page listing both, with its own switchboard number
+        record("https://www.manchester.gov.uk/foodbanks", Name="North Foodbank", Postcode="M1 1AA", Phone="0161 234 5000"),
+        record("https://www.manchester.gov.uk/foodbanks", Name="South Foodbank", Postcode="M14 5AB", Phone="0161 234 5000"),
+    ], domain_of)
+    assert len(foodbanks) == 2
+    assert sorted(len(f["sources"]) for f in foodbanks) == [2, 2]
+
+def test_error_and_empty_records_are_left_out():
+    foodbanks = resolve([
+        {"url": "https://a.example.com/", "structured": {"error": "timed out"}},
+        {"url": "https://b.example.com/", "structured": {}},
+        {"url": "https://c.example.com/", "type": "directory"},
+        record("https://northfoodbank.org.uk/", Name="North Foodbank"),
+    ], domain_of)
+    assert [f["url"] for f in foodbanks] == ["https://northfoodbank.org.uk/"]
+
+def test_site_key():
+    assert site_key("https://www.northfoodbank.org.uk/contact", domain_of) == "northfoodbank.org.uk"
+    assert site_key("https://south.foodbank.org.uk/", domain_of) == "south.foodbank.org.uk"
+    assert site_key("https://www.facebook.com/groups/northpantry/posts/1", domain_of) == "facebook.com/groups/northpantry"
+    assert site_key("https://m.facebook.com/NorthFoodbank", domain_of) == "facebook.com/northfoodbank"
+    assert site_key("https://www.manchester.gov.uk/foodbanks", domain_of) is None
+    assert site_key("https://www.facebook.com/", domain_of) is None
@@ -0,0 +1,49 @@
+from urlnorm import absolute_url, canonical_url
+
+
+def test_links_resolve_like_a_browser():
+    page = "https://example.org/services/food/help.html?x=1"
+    assert absolute_url(page, "../contact") == "https://example.org/services/contact"
+    assert absolute_url(page, "opening-times") == "https://example.org/services/food/opening-times"
+    assert absolute_url(page, "/about") == "https://example.org/about"
+    assert absolute_url(page, "?page=2") == "https://example.org/services/food/help.html?page=2"
+    assert absolute_url(page, "//cdn.example.org/a") == "https://cdn.example.org/a"
+
+def test_fragments_are_dropped():
+    page = "https://example.org/services/"
+    assert absolute_url(page, "#opening-times") == "https://example.org/services/"
+    assert absolute_url(page, "help#top") == "https://example.org/services/help"
+
+def test_non_web_links_are_skipped():
+    page = "https://example.org/"
+    for href in ["mailto:help@example.org", "tel:01611234567", "javascript:void(0)", "", "   ", None]:
+        assert absolute_url(page, href) is None
+
+def test_variants_of_one_page_share_a_canonical_url():
+    variants = [
+        "https://example.org/get-help",
+        "http://example.org/get-help",
+        "https://www.example.org/get-help",
+        "https://example.org/get-help/",
+        "https://EXAMPLE.org:443/get-help",
+        "https://example.org//get-help",
+        "https://example.org/get-help#opening-times",
+        "https://example.org/get-help?utm_source=google&utm_medium=cpc",
+        "https://example.org/get-help?fbclid=abc123",
+    ]
+    assert {canonical_url(u) for u in variants} == {"https://example.org/get-help"}
+
+def test_site_roots_and_index_pages_match():
+    roots = ["https://example.org", "http://www.example.org/", "https://example.org/index.html"]
+    assert {canonical_url(u) for u in roots} == {"https://example.org"}
+    assert canonical_url("https://example.org/a/b/../c/./index.php") == "https://example.org/a/c"
+
+def test_meaningful_queries_are_kept_in_order():
+    assert canonical_url("https://example.org/list?page=2&area=m14") == canonical_url(
+        "https://example.org/list?area=m14&utm_campaign=x&page=2")
+    assert canonical_url("https://example.org/list?page=2") != canonical_url("https://example.org/list?page=3")
+
+def test_different_pages_stay_apart():
+    assert canonical_url("https://example.org/north") != canonical_url("https://example.org/south")
+    assert canonical_url("https://north.example.org/") != canonical_url("https://example.org/")
+    assert canonical_url("https://example.org:8080/") != canonical_url("https://example.org/")
@@ -0,0 +1,67 @@
+"""
+Resolving links and deciding when two URLs are the same page.
+
+Links on a page are resolved with urljoin against the page's own URL, so
+"../", query-only and page-relative links land where a browser would take
+them. canonical_url() then maps the usual variants of one page (http or https,
+with or without www., a trailing slash, tracking parameters, a #fragment) to
+one key, which the crawler uses to fetch each page once per run.
+"""
+from urllib.parse import parse_qsl, urlencode, urldefrag, urljoin, urlsplit, urlunsplit
+
+# Query parameters that only say how the visitor got there
+TRACKING_PARAMS = {"gclid", "dclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "yclid", "igshid"}
+TRACKING_PREFIXES = ("utm_",)
+
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+_INDEX_PAGES = ("index.html", "index.htm", "index.php", "default.aspx")
+
+
+def absolute_url(base_url, href):
+    """
+    The absolute http(s) URL a link on `base_url` points to, without its
+    fragment, or None for mailto:, tel:, javascript: and other non-web links.
+    """
+    href = (href or "").strip()
+    if not href:
+        return None
+    try:
+        url, _ = urldefrag(urljoin(base_url, href))
+        if urlsplit(url).scheme not in ("http", "https"):
+            return None
+    except ValueError:  # e.g. a malformed IPv6 host
+        return None
+    return url
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def canonical_url(url):
+    """
+    A dedupe key for the page at `url`. Not meant to be fetched: the scheme is
+    always https and the host loses its www.
+    """
+    parts = urlsplit((url or "").strip())
+    host = (parts.hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and str(port) == _DEFAULT_PORTS.get(parts.scheme.lower()):
+        port = None
+    netloc = f"{host}:{port}" if port else host
+
+    path = parts.path or "/"
+    while "//" in path:
+        path = path.replace("//", "/")
+    # urljoin against the root resolves any ./ and ../ left in the path
+    path = urlsplit(urljoin("http://x/", path)).path
+    if path.endswith(_INDEX_PAGES):
+        path = path.rsplit("/", 1)[0] + "/"
+    path = path.rstrip("/")
+
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k))
+    return urlunsplit(("https", netloc, path, urlencode(query), ""))